@@ -0,0 +1,110 @@
+"""
+渲染器效能測試：以相同的模擬筆劃比較點陣 (raster) 與 OpenGL 渲染器每個畫面的繪製時間。
+
+    python benchmarks/renderer_bench.py [raster|opengl ...] [--frames N] [--size 1920x1080]
+
+沒有 GPU 的 Linux 可以在 Xvfb 上以 Mesa llvmpipe 執行 OpenGL 渲染器：
+
+    LIBGL_ALWAYS_SOFTWARE=1 xvfb-run -s "-screen 0 1920x1080x24" python benchmarks/renderer_bench.py raster opengl
+
+平台無法建立 OpenGL 內容時 (例如 QT_QPA_PLATFORM=offscreen)，OpenGL 會改用點陣渲染器，
+輸出的「實際」欄位會顯示 raster。
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+import statistics
+
+if not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QEvent, QPointF, QSettings, QSize
+from PyQt5.QtGui import QMouseEvent
+
+from canvas_renderer import RENDERERS
+
+
+def _send_mouse(window, event_type, x, y, buttons=Qt.LeftButton):
+    button = Qt.NoButton if event_type == QEvent.MouseMove else Qt.LeftButton
+    QApplication.sendEvent(window, QMouseEvent(event_type, QPointF(x, y), button, buttons, Qt.NoModifier))
+
+
+def _wait_frame(app, window, frame_ms: float):
+    """處理事件直到下一個畫面的時間點，讓畫面排程器依更新率送出重繪。"""
+    deadline = time.perf_counter() + frame_ms / 1000.0
+    while time.perf_counter() < deadline:
+        app.processEvents()
+
+
+def run(app, name: str, frames: int, size: QSize):
+    from screen_draw import ScreenDrawWindow
+    window = ScreenDrawWindow()
+    window.resize(size)
+    window.toggle_drawing_mode(True)
+    actual = window.set_renderer(name)
+    app.processEvents()
+
+    paint_times = []
+    original = window._frame_painted
+    def record(paint_start):
+        paint_times.append((time.perf_counter() - paint_start) * 1000.0)
+        original(paint_start)
+    window._frame_painted = record
+
+    frame_ms = 1000.0 / window.frame_scheduler.frame_rate
+    window.handle_tool_change('freehand')
+    width, height = size.width(), size.height()
+    start = time.perf_counter()
+    for stroke in range(max(1, frames // 120)):
+        y0 = height * (0.2 + 0.6 * ((stroke * 37) % 100) / 100)
+        _send_mouse(window, QEvent.MouseButtonPress, 50, y0)
+        for i in range(min(120, frames)):
+            # 每個畫面送出數個滑鼠事件，模擬高回報率的滑鼠
+            for k in range(4):
+                t = i * 4 + k
+                _send_mouse(window, QEvent.MouseMove, 50 + t * (width - 100) / 480, y0 + 80 * math.sin(t / 20))
+            _wait_frame(app, window, frame_ms)
+        _send_mouse(window, QEvent.MouseButtonRelease, width - 50, y0, Qt.NoButton)
+        app.processEvents()
+    elapsed = time.perf_counter() - start
+
+    window._frame_painted = original
+    window.hide()
+    window.deleteLater()
+    app.processEvents()
+    if paint_times:
+        p95 = sorted(paint_times)[int(len(paint_times) * 0.95)]
+        print(f"{name:<8} 實際 {actual:<8} {len(paint_times):5d} 個畫面  平均 {statistics.mean(paint_times):6.2f} ms"
+              f"  p95 {p95:6.2f} ms  總時間 {elapsed:5.2f} s")
+    else:
+        print(f"{name:<8} 實際 {actual:<8} 沒有繪製任何畫面")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("renderers", nargs="*", help="要比較的渲染器 (預設: %s)" % " ".join(RENDERERS))
+    parser.add_argument("--frames", type=int, default=480)
+    parser.add_argument("--size", default="1920x1080")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+    for name in args.renderers:
+        if name not in RENDERERS:
+            parser.error(f"未知的渲染器: {name}")
+
+    # 使用暫存的設定檔，測試不會改動使用者的畫記設定
+    settings_dir = tempfile.mkdtemp(prefix="renderer_bench_")
+    QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, settings_dir)
+    app = QApplication.instance() or QApplication(sys.argv)
+    print(f"平台 {app.platformName()}，畫布 {width}x{height}")
+    for name in args.renderers or RENDERERS:
+        run(app, name, args.frames, QSize(width, height))
+    return app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+筆劃繪製的微型效能測試：比較每個滑鼠事件在改用 StrokeSession 前後，
+從 Python 建立的 Qt 物件數量 (QPainter、QPen、QColor、QPoint、QPainterPath、QRect) 與平均耗時；
+「point runs」一次交給 StrokeSession 一個畫面內的所有座標 (1000 Hz 的裝置在 60 Hz 螢幕上約 16 個)。
+
+    python benchmarks/stroke_session_bench.py [事件數]
+"""
+import os
+import sys
+import math
+import time
+from array import array
+from collections import Counter
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QPoint, QRect
+from PyQt5.QtGui import QPainter, QPen, QColor, QPainterPath, QImage
+
+import draw_commands
+from draw_commands import DrawCommand, StrokeSession
+
+COUNTED_CLASSES = (QPainter, QPen, QColor, QPoint, QPainterPath, QRect)
+
+
+def _counting_class(cls, counter: Counter):
+    """建立會在建構時計數的子類別，用來替換模組中的 Qt 類別名稱。"""
+    def __init__(self, *args):
+        counter[cls.__name__] += 1
+        cls.__init__(self, *args)
+    namespace = {'__init__': __init__}
+    if cls is QColor:
+        def from_rgba(rgba):
+            counter['QColor'] += 1
+            return cls.fromRgba(rgba)
+        namespace['fromRgba'] = staticmethod(from_rgba)
+    return type(cls.__name__, (cls,), namespace)
+
+
+class AllocationCounter:
+    """在 with 區塊內替換 draw_commands 與本模組中的 Qt 類別，統計建構次數。"""
+    def __init__(self):
+        self.counts = Counter()
+        self._saved = []
+
+    def __enter__(self):
+        for module_globals in (vars(draw_commands), globals()):
+            for cls in COUNTED_CLASSES:
+                self._saved.append((module_globals, cls.__name__, module_globals[cls.__name__]))
+                module_globals[cls.__name__] = _counting_class(cls, self.counts)
+        return self
+
+    def __exit__(self, *exc):
+        for module_globals, name, value in reversed(self._saved):
+            module_globals[name] = value
+        self._saved.clear()
+
+
+def legacy_event(image, command: DrawCommand, pos):
+    """重現改版前每個滑鼠事件的做法：每次都建立新的 QPainter、QPen、QColor、QPoint 與 QPainterPath。"""
+    command.add_point(pos)
+    index = command.point_count() - 1
+    painter = QPainter(image)
+    painter.setPen(QPen(QColor.fromRgba(command.rgba), command.width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+    painter.setRenderHint(QPainter.Antialiasing, command.antialias)
+    points = [QPoint(command.points[i * 2], command.points[i * 2 + 1]) for i in range(max(0, index - 2), index + 1)]
+    if len(points) == 3:
+        p1, p2, p3 = points
+        mid1 = QPoint((p1.x() + p2.x()) // 2, (p1.y() + p2.y()) // 2)
+        mid2 = QPoint((p2.x() + p3.x()) // 2, (p2.y() + p3.y()) // 2)
+        path = QPainterPath()
+        path.moveTo(mid1)
+        path.quadTo(p2, mid2)
+        painter.drawPath(path)
+    painter.end()
+    rect = QRect(points[0], points[0])
+    for p in points[1:]:
+        rect = rect.united(QRect(p, p))
+    margin = int(math.ceil(command.width)) // 2 + 2
+    return rect.adjusted(-margin, -margin, margin, margin)
+
+
+def stroke_positions(count: int) -> list:
+    return [QPoint(100 + i % 1600, 400 + int(200 * math.sin(i / 25))) for i in range(count)]
+
+
+def run(name: str, events: int, use_session: bool, run_length: int = 1):
+    image = QImage(1920, 1080, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    positions = stroke_positions(events)
+    command = DrawCommand('freehand', QColor(255, 0, 0), 5.0, antialias=True, smooth=True)
+    session = StrokeSession(image, command) if use_session else None  # 在按下滑鼠時建立，不計入每個事件
+    with AllocationCounter() as counter:
+        start = time.perf_counter()
+        if use_session:
+            # 座標在事件處理時就放進 array，這裡只量測交給 StrokeSession 之後的成本
+            points = array('i', (v for pos in positions for v in (pos.x(), pos.y())))
+            step = run_length * 2
+            for i in range(0, len(points), step):
+                session.add_points(points[i:i + step])
+        else:
+            for pos in positions:
+                legacy_event(image, command, pos)
+        elapsed = time.perf_counter() - start
+    if session is not None:
+        session.finish()
+    per_event = ", ".join(f"{cls.__name__} {counter.counts[cls.__name__] / events:.2f}"
+                          for cls in COUNTED_CLASSES)
+    print(f"{name:<14} {elapsed / events * 1e6:8.1f} us/event   {per_event}")
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    app = QApplication.instance() or QApplication(sys.argv)
+    print(f"{events} 個滑鼠事件，平滑化手繪筆劃 (每個事件建立的 Qt 物件數)")
+    run("per-event", events, use_session=False)
+    run("StrokeSession", events, use_session=True)
+    run("point runs", events, use_session=True, run_length=16)
+    return app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import time
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import Qt, QRect, QRectF
+from PyQt5.QtGui import QPainter, QImage
+
+from draw_commands import render_command
+
+TILE_SIZE = 128
+
+
+def logical_rect(image: QImage) -> QRect:
+    """影像以邏輯座標表示的範圍；筆跡圖層以裝置像素配置並設定了 devicePixelRatio。"""
+    dpr = image.devicePixelRatio()
+    return QRect(0, 0, round(image.width() / dpr), round(image.height() / dpr))
+
+
+def device_rect(rect: QRect, dpr: float) -> QRect:
+    """將邏輯座標的 rect 換算成裝置像素 (向外取整，確保涵蓋所有相關像素)。"""
+    if dpr == 1:
+        return QRect(rect)
+    return QRectF(rect.x() * dpr, rect.y() * dpr, rect.width() * dpr, rect.height() * dpr).toAlignedRect()
+
+
+class CompressedTile:
+    """以 zlib 壓縮的圖塊像素資料，需要時再還原成 QImage。"""
+    __slots__ = ('data', 'width', 'height', 'bytes_per_line', 'format', 'device_pixel_ratio')
+
+    def __init__(self, image: QImage):
+        bits = image.constBits()
+        bits.setsize(image.sizeInBytes())
+        self.data = zlib.compress(bytes(bits), 1)
+        self.width = image.width()
+        self.height = image.height()
+        self.bytes_per_line = image.bytesPerLine()
+        self.format = image.format()
+        self.device_pixel_ratio = image.devicePixelRatio()
+
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def to_image(self) -> QImage:
+        data = zlib.decompress(self.data)
+        # QImage 不會持有 data，因此立即複製一份獨立的影像
+        image = QImage(data, self.width, self.height, self.bytes_per_line, self.format).copy()
+        image.setDevicePixelRatio(self.device_pixel_ratio)
+        return image
+
+
+class Checkpoint:
+    """某一步驟時畫布的點陣快照，只保存曾經有筆跡的圖塊。"""
+    __slots__ = ('index', 'tiles', 'inked_tiles', 'compressed')
+
+    def __init__(self, index: int, tiles: dict, inked_tiles: frozenset):
+        self.index = index              # 快照對應的是「套用前 index 筆指令」後的狀態
+        self.tiles = tiles              # {(tx, ty): QImage 或 CompressedTile}
+        self.inked_tiles = inked_tiles
+        self.compressed = False
+
+    def nbytes(self, counted: set = None) -> int:
+        """快照佔用的位元組數；指定 counted 時，已計算過的 (與其他快照共用的) 圖塊不重複計算。"""
+        tiles = self.tiles  # 背景執行緒可能同時替換整個 dict，先取得參考
+        total = 0
+        for tile in tiles.values():
+            if counted is not None:
+                if id(tile) in counted:
+                    continue
+                counted.add(id(tile))
+            total += tile_nbytes(tile)
+        return total
+
+
+def tile_nbytes(tile) -> int:
+    return tile.nbytes() if isinstance(tile, CompressedTile) else tile.sizeInBytes()
+
+
+def tile_size(tile) -> tuple:
+    """以裝置像素表示的圖塊大小 (寬, 高)。"""
+    if isinstance(tile, CompressedTile):
+        return tile.width, tile.height
+    return tile.width(), tile.height()
+
+
+def tile_image(tile) -> QImage:
+    return tile.to_image() if isinstance(tile, CompressedTile) else tile
+
+
+class CommandHistory:
+    """
+    指令式 (向量) 復原/重做紀錄。
+    每一個提交的操作都以 DrawCommand 保存；每隔 checkpoint_interval 步
+    (以及每次清除畫面時) 保存一次只含筆跡圖塊的點陣快照。
+    復原時從最近的快照重播，因此延遲最多只需重播 checkpoint_interval 筆指令。
+
+    最新的 hot_checkpoints 個快照保持未壓縮，較舊的快照會在背景執行緒中壓縮；
+    總用量超過 budget_bytes 時先壓縮快照，仍然超過才捨棄最舊的紀錄，
+    但最新兩個快照之間的步驟與至少 min_undo_steps 步一律保留。
+    """
+    def __init__(self, budget_bytes: int = 64 * 1024 * 1024, checkpoint_interval: int = 50,
+                 hot_checkpoints: int = 2, tile_size: int = TILE_SIZE, min_undo_steps: int = 20):
+        self.budget_bytes = budget_bytes
+        self.min_undo_steps = min_undo_steps  # 即使超過預算也保證可以復原的步數
+        self.checkpoint_interval = checkpoint_interval
+        self.hot_checkpoints = hot_checkpoints
+        self.tile_size = tile_size
+        self._lock = threading.Lock()  # 保護背景壓縮時對 checkpoint.tiles 的替換
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-compress")
+        self.commands = []     # 目前已套用的指令
+        self.redo_stack = []
+        self.checkpoints = [Checkpoint(0, {}, frozenset())]
+        self._pending_rect = QRect()
+        self._inked_tiles = set()  # 自上次清除畫面後曾經被畫過的圖塊
+        self.last_restore_ms = 0.0  # 最近一次復原所花費的時間，方便量測延遲
+
+    def _tile_rect(self, key, bounds: QRect) -> QRect:
+        tx, ty = key
+        return QRect(tx * self.tile_size, ty * self.tile_size, self.tile_size, self.tile_size).intersected(bounds)
+
+    def _tiles_in(self, rect: QRect):
+        rect = rect.normalized()
+        size = self.tile_size
+        for ty in range(max(0, rect.top()) // size, max(0, rect.bottom()) // size + 1):
+            for tx in range(max(0, rect.left()) // size, max(0, rect.right()) // size + 1):
+                yield (tx, ty)
+
+    def touch(self, rect: QRect):
+        """在畫入畫布之前呼叫，累積目前操作的影響範圍。"""
+        self._pending_rect = self._pending_rect.united(rect.normalized())
+
+    def commit(self, image, command) -> bool:
+        """將一筆完成的指令寫入紀錄，並在需要時建立新的快照。"""
+        bounds = logical_rect(image)
+        if command.tool == 'clear':
+            dirty = bounds
+            self._inked_tiles.clear()
+        else:
+            dirty = self._pending_rect.intersected(bounds)
+            self._inked_tiles.update(self._tiles_in(dirty))
+        self._pending_rect = QRect()
+        command.rect = (dirty.x(), dirty.y(), dirty.width(), dirty.height())
+
+        # 新的操作會讓重做分支失效，包含該分支上的快照
+        self.drop_redo()
+
+        self.commands.append(command)
+        if command.tool == 'clear' or len(self.commands) - self.checkpoints[-1].index >= self.checkpoint_interval:
+            self._add_checkpoint(image)
+        self._trim()
+        return True
+
+    def discard(self):
+        self._pending_rect = QRect()
+
+    def redraw_pending(self, image, command):
+        """以完整品質重畫尚未提交的操作：先把它的影響範圍還原成操作前的狀態，再重播指令。"""
+        clip = self._pending_rect.intersected(logical_rect(image))
+        if clip.isEmpty():
+            return
+        self._restore(image, len(self.commands), clip)
+        painter = QPainter(image)
+        painter.setClipRect(clip)
+        render_command(painter, command)
+        painter.end()
+
+    def _add_checkpoint(self, image):
+        bounds = logical_rect(image)
+        dpr = image.devicePixelRatio()
+        # 增量擷取：上一個快照之後沒有被任何指令碰過的圖塊直接沿用上一個快照的內容，
+        # 只有被改動的圖塊才從筆跡圖層複製，滿版的畫布也不會每次都複製整張畫面
+        previous = self.checkpoints[-1]
+        with self._lock:
+            reusable = dict(previous.tiles)
+        changed = set()
+        for command in self.commands[previous.index:]:
+            if command.tool == 'clear':
+                reusable = {}
+                changed.clear()
+            else:
+                changed.update(self._tiles_in(command.bounding_rect()))
+        tiles = {}
+        for key in self._inked_tiles:
+            tile_rect = self._tile_rect(key, bounds)
+            if tile_rect.isEmpty():
+                continue
+            source = device_rect(tile_rect, dpr)
+            tile = reusable.get(key)
+            if key not in changed and tile is not None and tile_size(tile) == (source.width(), source.height()):
+                tiles[key] = tile
+            else:
+                # 筆跡圖層是 QImage，複製出來的圖塊可以直接交給背景執行緒壓縮；
+                # 圖塊以邏輯座標劃分，複製時換算成裝置像素 (複本保留 devicePixelRatio)
+                tiles[key] = image.copy(source)
+        self.checkpoints.append(Checkpoint(len(self.commands), tiles, frozenset(self._inked_tiles)))
+        if len(self.checkpoints) > self.hot_checkpoints:
+            self._schedule_compression(self.checkpoints[-1 - self.hot_checkpoints])
+
+    def _schedule_compression(self, checkpoint: Checkpoint):
+        if not checkpoint.compressed and checkpoint.tiles:
+            self._executor.submit(self._compress_checkpoint, checkpoint)
+
+    def _compress_checkpoint(self, checkpoint: Checkpoint):
+        """在背景執行緒執行：壓縮一個已離開熱區的快照。"""
+        with self._lock:
+            if checkpoint.compressed:
+                return
+            tiles = dict(checkpoint.tiles)
+        # 沿用自上一個快照的圖塊可能已經壓縮過
+        compressed = {key: tile if isinstance(tile, CompressedTile) else CompressedTile(tile)
+                      for key, tile in tiles.items()}
+        with self._lock:
+            checkpoint.tiles = compressed
+            checkpoint.compressed = True
+
+    def compress_all(self):
+        """立即壓縮所有快照（包含熱區），供記憶體吃緊時使用。"""
+        for checkpoint in list(self.checkpoints):
+            if not checkpoint.compressed and checkpoint.tiles:
+                self._compress_checkpoint(checkpoint)
+
+    def drop_redo(self):
+        """捨棄重做分支，以及只屬於該分支的快照。"""
+        self.redo_stack.clear()
+        index = len(self.commands)
+        while self.checkpoints[-1].index > index:
+            self.checkpoints.pop()
+
+    def total_bytes(self) -> int:
+        """回傳目前紀錄 (快照 + 指令) 所佔用的位元組數。"""
+        with self._lock:
+            counted = set()
+            checkpoint_bytes = sum(checkpoint.nbytes(counted) for checkpoint in self.checkpoints)
+        command_bytes = sum(command.nbytes() for command in self.commands)
+        command_bytes += sum(command.nbytes() for command in self.redo_stack)
+        return checkpoint_bytes + command_bytes
+
+    def _trim(self):
+        if len(self.checkpoints) <= 2:
+            return
+        total = self.total_bytes()
+        if total <= self.budget_bytes:
+            return
+        # 捨棄任何步驟之前，先同步壓縮最新快照以外的所有快照 (包含仍在背景排隊的)，
+        # 否則尚未壓縮的熱區快照會以原始大小計入，導致不必要地捨棄大量步驟
+        for checkpoint in self.checkpoints[:-1]:
+            if not checkpoint.compressed and checkpoint.tiles:
+                self._compress_checkpoint(checkpoint)
+        total = self.total_bytes()
+        # 只能從快照處截斷，確保最舊的狀態仍可由快照還原；
+        # 最新的兩個快照之間的步驟一律保留，並且至少保留 min_undo_steps 步可以復原
+        while (total > self.budget_bytes and len(self.checkpoints) > 2
+               and len(self.commands) - self.checkpoints[1].index >= self.min_undo_steps):
+            drop = self.checkpoints[1].index
+            del self.commands[:drop]
+            del self.checkpoints[0]
+            for checkpoint in self.checkpoints:
+                checkpoint.index -= drop
+            total = self.total_bytes()
+
+    def can_undo(self) -> bool:
+        return bool(self.commands)
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_stack)
+
+    def undo(self, image):
+        """還原上一步，回傳需要重繪的範圍；沒有可復原的步驟時回傳 None。"""
+        if not self.commands:
+            return None
+        command = self.commands.pop()
+        self.redo_stack.append(command)
+        self._restore(image, len(self.commands))
+        return command.bounding_rect()
+
+    def redo(self, image):
+        if not self.redo_stack:
+            return None
+        command = self.redo_stack.pop()
+        painter = QPainter(image)
+        render_command(painter, command)
+        painter.end()
+        self.commands.append(command)
+        if command.tool == 'clear':
+            self._inked_tiles.clear()
+        else:
+            self._inked_tiles.update(self._tiles_in(command.bounding_rect()))
+        return command.bounding_rect()
+
+    def _restore(self, image, target: int, clip: QRect = None):
+        """將畫布還原成套用前 target 筆指令後的狀態；指定 clip 時只還原該範圍。"""
+        start = time.perf_counter()
+        checkpoint = self.checkpoints[0]
+        for candidate in self.checkpoints:
+            if candidate.index > target:
+                break
+            checkpoint = candidate
+
+        with self._lock:
+            tiles = dict(checkpoint.tiles)
+
+        bounds = logical_rect(image)
+        painter = QPainter(image)
+        if clip is None:
+            image_clip = bounds
+        else:
+            image_clip = clip.intersected(bounds)
+            painter.setClipRect(image_clip)
+        painter.setCompositionMode(QPainter.CompositionMode_Clear)
+        painter.fillRect(image_clip, Qt.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for key, tile in tiles.items():
+            tile_rect = self._tile_rect(key, bounds)
+            if tile_rect.intersects(image_clip):
+                painter.drawImage(tile_rect.topLeft(), tile_image(tile))
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        inked_tiles = set(checkpoint.inked_tiles)
+        for command in self.commands[checkpoint.index:target]:
+            render_command(painter, command)
+            if command.tool == 'clear':
+                inked_tiles.clear()
+            else:
+                inked_tiles.update(self._tiles_in(command.bounding_rect()))
+        painter.end()
+        if clip is None:
+            self._inked_tiles = inked_tiles
+        self.last_restore_ms = (time.perf_counter() - start) * 1000.0
+
+    def clear(self):
+        self.commands.clear()
+        self.redo_stack.clear()
+        self.checkpoints = [Checkpoint(0, {}, frozenset())]
+        self._pending_rect = QRect()
+        self._inked_tiles.clear()
+
+    def shutdown(self):
+        """結束背景壓縮執行緒；畫布移除時呼叫，尚未開始的壓縮工作直接取消。"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
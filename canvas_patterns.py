@@ -0,0 +1,117 @@
+from PyQt5.QtCore import Qt, QPointF, QRect
+from PyQt5.QtGui import QPainter, QPixmap, QPen, QColor, QBrush, QPolygonF
+
+# (設定值, 工具列顯示文字)
+PATTERN_LABELS = [
+    ('none', "無"),
+    ('fine_grid', "細方格"),
+    ('coarse_grid', "粗方格"),
+    ('dot_grid', "點狀格線"),
+    ('ruled', "橫線"),
+    ('music_staff', "五線譜"),
+    ('axes', "座標軸"),
+]
+
+PATTERN_COLOR = QColor(128, 128, 128, 100)
+AXIS_COLOR = QColor(128, 128, 128, 200)
+
+_tile_cache = {}  # {(pattern, dpr): QPixmap}
+
+
+def pattern_from_label(label: str) -> str:
+    return dict((text, name) for name, text in PATTERN_LABELS).get(label, 'none')
+
+
+def label_from_pattern(pattern: str) -> str:
+    return dict(PATTERN_LABELS).get(pattern, "無")
+
+
+def _grid_tile(painter: QPainter, size: int):
+    # 反鋸齒的 1px 線條會跨在整數座標兩側，因此左右(上下)兩邊都要畫，拼接時才會完整
+    painter.setPen(QPen(PATTERN_COLOR, 1, Qt.SolidLine))
+    for x in (0, size):
+        painter.drawLine(x, 0, x, size)
+    for y in (0, size):
+        painter.drawLine(0, y, size, y)
+
+
+def _render_tile(pattern: str, dpr: float):
+    if pattern == 'fine_grid' or pattern == 'axes':
+        width = height = 25
+    elif pattern == 'coarse_grid':
+        width = height = 75
+    elif pattern == 'dot_grid':
+        width = height = 25
+    elif pattern == 'ruled':
+        width, height = 64, 40
+    elif pattern == 'music_staff':
+        width, height = 64, 120
+    else:
+        return None
+
+    tile = QPixmap(int(width * dpr), int(height * dpr))
+    tile.setDevicePixelRatio(dpr)
+    tile.fill(Qt.transparent)
+    painter = QPainter(tile)
+    painter.setRenderHint(QPainter.Antialiasing)
+    if pattern in ('fine_grid', 'coarse_grid', 'axes'):
+        _grid_tile(painter, width)
+    elif pattern == 'dot_grid':
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(128, 128, 128, 160))
+        for x in (0, width):
+            for y in (0, height):
+                painter.drawEllipse(QPointF(x, y), 1.5, 1.5)
+    elif pattern == 'ruled':
+        painter.setPen(QPen(PATTERN_COLOR, 1, Qt.SolidLine))
+        for y in (0, height):
+            painter.drawLine(0, y, width, y)
+    elif pattern == 'music_staff':
+        painter.setPen(QPen(PATTERN_COLOR, 1, Qt.SolidLine))
+        for line in range(5):
+            y = 36 + line * 12
+            painter.drawLine(0, y, width, y)
+    painter.end()
+    return tile
+
+
+def pattern_tile(pattern: str, dpr: float):
+    """取得某種格線樣式在指定 DPR 下的材質圖塊；同一組合只會繪製一次。"""
+    key = (pattern, dpr)
+    if key not in _tile_cache:
+        _tile_cache[key] = _render_tile(pattern, dpr)
+    return _tile_cache[key]
+
+
+def _draw_axes(painter: QPainter, canvas_rect: QRect):
+    """座標軸不是週期性圖案，直接以畫布中心畫出 x、y 軸與箭頭。"""
+    center = canvas_rect.center()
+    cx = center.x() - center.x() % 25  # 對齊格線
+    cy = center.y() - center.y() % 25
+    head = 10
+    painter.save()
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setPen(QPen(AXIS_COLOR, 2, Qt.SolidLine))
+    painter.drawLine(canvas_rect.left(), cy, canvas_rect.right(), cy)
+    painter.drawLine(cx, canvas_rect.top(), cx, canvas_rect.bottom())
+    painter.setPen(Qt.NoPen)
+    painter.setBrush(AXIS_COLOR)
+    right, top = canvas_rect.right(), canvas_rect.top()
+    painter.drawPolygon(QPolygonF([QPointF(right, cy), QPointF(right - head, cy - head / 2), QPointF(right - head, cy + head / 2)]))
+    painter.drawPolygon(QPolygonF([QPointF(cx, top), QPointF(cx - head / 2, top + head), QPointF(cx + head / 2, top + head)]))
+    painter.restore()
+
+
+def paint_pattern(painter: QPainter, rect: QRect, pattern: str, canvas_rect: QRect):
+    """以快取的材質圖塊填滿 rect；圖塊依繪圖裝置的 DPR 產生，因此縮放後仍然銳利。"""
+    if pattern == 'none':
+        return
+    tile = pattern_tile(pattern, painter.device().devicePixelRatioF())
+    if tile is None:
+        return
+    painter.fillRect(rect, QBrush(tile))
+    if pattern == 'axes':
+        painter.save()
+        painter.setClipRect(rect, Qt.IntersectClip)
+        _draw_axes(painter, canvas_rect)
+        painter.restore()
@@ -0,0 +1,283 @@
+import logging
+import time
+from PyQt5 import sip
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import (QImage, QPainter, QRegion, QVector2D, QSurfaceFormat, QOpenGLContext,
+                         QOpenGLShader, QOpenGLShaderProgram, QOpenGLTexture,
+                         QOpenGLPixelTransferOptions, QOpenGLVersionProfile)
+from PyQt5.QtWidgets import QWidget, QOpenGLWidget
+
+logger = logging.getLogger(__name__)
+
+RENDERER_RASTER = 'raster'
+RENDERER_OPENGL = 'opengl'
+RENDERERS = (RENDERER_RASTER, RENDERER_OPENGL)
+
+# PyQt5 的 QOpenGLFunctions_2_0 不提供 GL 常數
+GL_BLEND = 0x0BE2
+GL_COLOR_BUFFER_BIT = 0x4000
+GL_ONE = 1
+GL_ONE_MINUS_SRC_ALPHA = 0x0303
+GL_TRIANGLE_STRIP = 0x0005
+
+_VERTEX_SHADER = """
+attribute highp vec2 position;
+varying highp vec2 texcoord;
+void main() {
+    texcoord = vec2((position.x + 1.0) * 0.5, (1.0 - position.y) * 0.5);
+    gl_Position = vec4(position, 0.0, 1.0);
+}
+"""
+
+_FRAGMENT_SHADER = """
+varying highp vec2 texcoord;
+uniform sampler2D layer;
+void main() {
+    gl_FragColor = texture2D(layer, texcoord);
+}
+"""
+
+_FULL_SCREEN_QUAD = [QVector2D(-1, -1), QVector2D(1, -1), QVector2D(-1, 1), QVector2D(1, 1)]
+
+
+def opengl_available() -> bool:
+    """確認目前的平台能否建立 OpenGL 2.0 以上的內容 (例如 Xvfb 上的 Mesa llvmpipe)。"""
+    context = QOpenGLContext()
+    if not context.create():
+        return False
+    return context.format().majorVersion() >= 2
+
+
+def create_renderer(window, name: str):
+    """依設定建立渲染器；選擇 OpenGL 但平台無法建立 OpenGL 內容時，改用預設的點陣渲染器。"""
+    if name == RENDERER_OPENGL:
+        if opengl_available():
+            return GLRenderer(window)
+        logger.warning("OpenGL context unavailable, falling back to the raster renderer")
+    elif name != RENDERER_RASTER:
+        logger.warning("Unknown renderer %r, using the raster renderer", name)
+    return RasterRenderer(window)
+
+
+class RasterRenderer:
+    """
+    預設的渲染器：由視窗的 paintEvent 以 QPainter (點陣繪圖引擎) 合成背景、筆跡與預覽圖層，
+    只重繪 update() 指定的區域。
+    """
+    name = RENDERER_RASTER
+
+    def __init__(self, window):
+        self.window = window
+
+    def paints_window(self) -> bool:
+        return True
+
+    def update(self, *args):
+        QWidget.update(self.window, *args)
+
+    def resize(self, size):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class GLRenderer:
+    """
+    OpenGL 渲染器：以覆蓋整個視窗的 GLCanvasView 顯示畫面。
+    滑鼠與鍵盤事件仍由視窗處理，重繪要求轉給 GLCanvasView，
+    OpenGL 初始化失敗時由視窗改回點陣渲染器。
+    """
+    name = RENDERER_OPENGL
+
+    def __init__(self, window):
+        self.window = window
+        self.view = GLCanvasView(window)
+        self.view.setGeometry(window.rect())
+        self.view.lower()  # 工具列等子元件必須留在畫面上方
+        self.view.show()
+
+    def paints_window(self) -> bool:
+        return False
+
+    def update(self, *args):
+        self.view.invalidate(*args)
+
+    def resize(self, size):
+        self.view.setGeometry(QRect(0, 0, size.width(), size.height()))
+        self.view.invalidate()
+
+    def shutdown(self):
+        self.view.hide()
+        self.view.deleteLater()
+
+
+class GLCanvasView(QOpenGLWidget):
+    """
+    將背景 (背景加格線的靜態圖層)、筆跡與預覽三個圖層各保存為一張材質，每個畫面在 GPU 上疊合。
+    材質只在內容改變時上傳改變的範圍：靜態圖層在重建時整張上傳，
+    筆跡圖層與預覽圖層只上傳 invalidate() 累積的區域，因此筆劃進行中每個畫面只需要複製少量像素。
+    """
+    def __init__(self, window):
+        super().__init__(window)
+        self._window = window
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)  # 輸入事件交給底下的視窗
+        self.setFocusPolicy(Qt.NoFocus)
+        surface_format = QSurfaceFormat.defaultFormat()
+        surface_format.setAlphaBufferSize(8)  # 半透明畫布需要有透明度的畫面緩衝區
+        self.setFormat(surface_format)
+        self._gl = None
+        self._program = None
+        self._textures = {}       # 圖層名稱 -> QOpenGLTexture
+        self._texture_keys = {}   # 圖層名稱 -> 上傳時的內容識別 (cacheKey 與大小)
+        self._overlay_image = None
+        self._dirty_region = QRegion()
+        self._full_upload = True
+
+    def invalidate(self, *args):
+        """記錄需要重新上傳的範圍 (參數與 QWidget.update 相同；沒有參數代表整個畫面)，並排程重繪。"""
+        if not args:
+            self._full_upload = True
+        elif len(args) == 4:
+            self._dirty_region = self._dirty_region.united(QRect(*args))
+        else:
+            self._dirty_region = self._dirty_region.united(args[0])
+        self.update()
+
+    def initializeGL(self):
+        profile = QOpenGLVersionProfile()
+        profile.setVersion(2, 0)
+        self._gl = self.context().versionFunctions(profile)
+        program = QOpenGLShaderProgram(self)
+        program.bindAttributeLocation("position", 0)
+        if (self._gl is None
+                or not self._gl.initializeOpenGLFunctions()
+                or not program.addShaderFromSourceCode(QOpenGLShader.Vertex, _VERTEX_SHADER)
+                or not program.addShaderFromSourceCode(QOpenGLShader.Fragment, _FRAGMENT_SHADER)
+                or not program.link()):
+            logger.warning("OpenGL renderer initialization failed: %s", program.log())
+            self._gl = None
+            self._window.fall_back_to_raster_renderer()
+            return
+        self._program = program
+        self._textures.clear()
+        self._texture_keys.clear()
+        self._full_upload = True
+        self.context().aboutToBeDestroyed.connect(self._release_textures)
+
+    def _release_textures(self):
+        self.makeCurrent()
+        for texture in self._textures.values():
+            texture.destroy()
+        self._textures.clear()
+        self._texture_keys.clear()
+        self.doneCurrent()
+
+    def paintGL(self):
+        if self._program is None:
+            return
+        window = self._window
+        paint_start = time.perf_counter()
+        region = QRegion(self.rect()) if self._full_upload else self._dirty_region.intersected(self.rect())
+        full_upload = self._full_upload
+        self._dirty_region = QRegion()
+        self._full_upload = False
+
+        static_layer = window._ensure_static_layer()
+        if full_upload or self._layer_changed('background', static_layer):
+            # 靜態圖層只在畫布模式、格線或背景圖片改變時重建，重建後整張上傳一次
+            self._upload_layer('background', static_layer.toImage(), region, True)
+            self._texture_keys['background'] = self._layer_key(static_layer)
+        ink = window.image
+        if ink is not None and not ink.isNull():
+            with window._ink_lock(): # 背景執行緒畫完一批線段之前不會讀到一半的筆跡
+                self._upload_layer('ink', ink, region, full_upload or self._layer_changed('ink', ink))
+            self._texture_keys['ink'] = self._layer_key(ink)
+        self._upload_layer('overlay', self._render_overlay(region), region, full_upload)
+
+        gl = self._gl
+        gl.glClearColor(0.0, 0.0, 0.0, 0.0)
+        gl.glClear(GL_COLOR_BUFFER_BIT)
+        gl.glEnable(GL_BLEND)
+        gl.glBlendFunc(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)  # 材質內容為 premultiplied alpha
+        self._program.bind()
+        self._program.enableAttributeArray(0)
+        self._program.setAttributeArray(0, _FULL_SCREEN_QUAD)
+        for name in ('background', 'ink', 'overlay'):
+            texture = self._textures.get(name)
+            if texture is not None:
+                texture.bind(0)
+                gl.glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+                texture.release(0)
+        self._program.disableAttributeArray(0)
+        self._program.release()
+        gl.glDisable(GL_BLEND)
+        window._frame_painted(paint_start)
+
+    @staticmethod
+    def _layer_key(layer) -> tuple:
+        # cacheKey 的高 32 位元識別影像本身，低 32 位元在每次修改時遞增；
+        # 筆跡圖層在畫線時會一直修改，只有換成另一張影像 (復原、縮放、休眠) 時才需要整張上傳
+        return layer.cacheKey() >> 32, layer.size()
+
+    def _layer_changed(self, name: str, layer) -> bool:
+        return self._texture_keys.get(name) != self._layer_key(layer)
+
+    def _render_overlay(self, region: QRegion) -> QImage:
+        """將預覽、雷射筆軌跡與橡皮擦圓圈畫入預覽圖層；只清除並重畫 region 內的像素。"""
+        dpr = self.devicePixelRatioF()
+        size = self.size() * dpr
+        if self._overlay_image is None or self._overlay_image.size() != size:
+            self._overlay_image = QImage(size, QImage.Format_ARGB32_Premultiplied)
+            self._overlay_image.setDevicePixelRatio(dpr)
+            self._overlay_image.fill(Qt.transparent)
+            region = QRegion(self.rect())
+        painter = QPainter(self._overlay_image)
+        painter.setClipRegion(region)
+        painter.setCompositionMode(QPainter.CompositionMode_Clear)
+        painter.fillRect(self.rect(), Qt.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self._window._paint_overlay(painter)
+        painter.end()
+        return self._overlay_image
+
+    def _upload_layer(self, name: str, image: QImage, region: QRegion, whole: bool):
+        """將圖層上傳成材質；whole 為 False 時只上傳 region 內的像素 (region 為視窗座標)。"""
+        if image.format() != QImage.Format_ARGB32_Premultiplied:
+            image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        texture = self._textures.get(name)
+        if texture is None or texture.width() != image.width() or texture.height() != image.height():
+            if texture is not None:
+                texture.destroy()
+            texture = QOpenGLTexture(QOpenGLTexture.Target2D)
+            texture.setFormat(QOpenGLTexture.RGBA8_UNorm)
+            texture.setSize(image.width(), image.height())
+            texture.setMinMagFilters(QOpenGLTexture.Linear, QOpenGLTexture.Linear)
+            texture.setWrapMode(QOpenGLTexture.ClampToEdge)
+            texture.allocateStorage(QOpenGLTexture.BGRA, QOpenGLTexture.UInt8)
+            self._textures[name] = texture
+            whole = True
+        if whole:
+            self._upload_rect(texture, image, image.rect())
+        else:
+            # 圖層可能以裝置像素保存，將視窗座標換算成圖層像素
+            scale_x = image.width() / max(1, self.width())
+            scale_y = image.height() / max(1, self.height())
+            for rect in region.rects():
+                self._upload_rect(texture, image, QRect(int(rect.x() * scale_x), int(rect.y() * scale_y),
+                                                        int(rect.width() * scale_x + 1), int(rect.height() * scale_y + 1)))
+
+    @staticmethod
+    def _upload_rect(texture: QOpenGLTexture, image: QImage, rect: QRect):
+        """以 glTexSubImage2D 上傳 image 中的 rect；每列的長度設為整張圖片的寬度，不必先複製出子圖。"""
+        rect = rect.intersected(image.rect())
+        if rect.isEmpty():
+            return
+        options = QOpenGLPixelTransferOptions()
+        options.setRowLength(image.bytesPerLine() // 4)
+        options.setAlignment(4)
+        offset = rect.y() * image.bytesPerLine() + rect.x() * 4
+        data = sip.voidptr(int(image.constBits()) + offset)
+        texture.setData(rect.x(), rect.y(), 0, rect.width(), rect.height(), 1,
+                        QOpenGLTexture.BGRA, QOpenGLTexture.UInt8, data, options)
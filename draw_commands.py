@@ -0,0 +1,539 @@
+import math
+from array import array
+from fractions import Fraction
+from functools import lru_cache
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect
+from PyQt5.QtGui import QPainter, QPen, QColor, QPainterPath, QFont, QFontMetricsF, QImage, QStaticText, QTransform
+
+STROKE_TOOLS = ('freehand', 'highlighter', 'eraser')
+SHAPE_TOOLS = ('line', 'arrow', 'rectangle', 'circle')
+
+
+class DrawCommand:
+    """
+    一筆已提交的繪圖操作（向量形式）。
+    座標以 array('i') 緊密儲存，顏色以 QRgba 整數儲存，
+    讓復原紀錄可以保存數千步，並在需要時重播回畫布上。
+    """
+    __slots__ = ('tool', 'points', 'rgba', 'width', 'antialias', 'smooth', 'extra', 'rect')
+
+    def __init__(self, tool: str, color: QColor = None, width: float = 0.0,
+                 antialias: bool = True, smooth: bool = False, extra=None):
+        self.tool = tool
+        self.points = array('i')
+        self.rgba = color.rgba() if color is not None else 0
+        self.width = width
+        self.antialias = antialias
+        self.smooth = smooth
+        self.extra = extra
+        self.rect = None  # (x, y, w, h)，提交時由復原紀錄填入
+
+    def add_point(self, point: QPoint):
+        self.points.append(point.x())
+        self.points.append(point.y())
+
+    def add_points(self, points):
+        """加入一串座標 (x0, y0, x1, y1, ...)，例如一個畫面內累積的所有輸入位置。"""
+        self.points.extend(points)
+
+    def point_count(self) -> int:
+        return len(self.points) // 2
+
+    def point(self, index: int) -> QPoint:
+        return QPoint(self.points[index * 2], self.points[index * 2 + 1])
+
+    def color(self) -> QColor:
+        return QColor.fromRgba(self.rgba)
+
+    def bounding_rect(self) -> QRect:
+        return QRect(*self.rect) if self.rect else QRect()
+
+    def nbytes(self) -> int:
+        """粗估此指令佔用的記憶體（不含 Python 物件本身的固定開銷）。"""
+        size = self.points.itemsize * len(self.points)
+        if self.tool == 'text' and self.extra:
+            size += len(self.extra[0]) * 2 + len(self.extra[1])
+        elif self.tool == 'eraser' and self.extra:
+            size += self.extra.itemsize * len(self.extra)
+        elif isinstance(self.extra, PenSamples):
+            size += self.extra.nbytes()
+        return size
+
+
+class PenSamples:
+    """
+    觸控筆筆劃每個點的壓力、傾斜與時間，以 array 緊密保存 (每點 7 個位元組)：
+    壓力量化為 0~255，傾斜為 -60~60 度，時間為相對於筆劃開始的毫秒數。
+    存在手繪指令的 extra 中，繪製與重播時依壓力決定每一段的筆寬。
+    """
+    __slots__ = ('pressure', 'tilt', 'time')
+    MIN_WIDTH_FACTOR = 0.25  # 最輕的筆壓仍保留四分之一的筆寬
+
+    def __init__(self):
+        self.pressure = array('B')
+        self.tilt = array('b')  # 每點 x, y 兩個值
+        self.time = array('I')
+
+    def __len__(self) -> int:
+        return len(self.pressure)
+
+    def add(self, pressure: float, x_tilt: int, y_tilt: int, time_ms: int):
+        self.pressure.append(max(0, min(255, round(pressure * 255))))
+        self.tilt.append(max(-128, min(127, x_tilt)))
+        self.tilt.append(max(-128, min(127, y_tilt)))
+        self.time.append(max(0, time_ms))
+
+    def extend(self, other: 'PenSamples'):
+        self.pressure.extend(other.pressure)
+        self.tilt.extend(other.tilt)
+        self.time.extend(other.time)
+
+    def width_factor(self, first: int, last: int) -> float:
+        """第 first 與第 last 個點平均壓力對應的筆寬比例。"""
+        pressure = self.pressure
+        count = len(pressure)
+        if not count:
+            return 1.0
+        average = (pressure[min(first, count - 1)] + pressure[min(last, count - 1)]) / 510.0
+        return self.MIN_WIDTH_FACTOR + (1.0 - self.MIN_WIDTH_FACTOR) * average
+
+    def nbytes(self) -> int:
+        return sum(samples.itemsize * len(samples) for samples in (self.pressure, self.tilt, self.time))
+
+
+def command_pen(command: DrawCommand) -> QPen:
+    if command.tool == 'eraser':
+        return QPen(Qt.transparent, command.width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+    if command.tool == 'highlighter':
+        # 螢光筆以不透明的顏色畫進暫存圖層，指令顏色的透明度在合成整筆時才套用
+        color = command.color()
+        color.setAlpha(255)
+        return QPen(color, command.width, Qt.SolidLine, Qt.SquareCap, Qt.RoundJoin)
+    return QPen(command.color(), command.width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+
+
+def stroke_margin(command: DrawCommand) -> int:
+    width = int(math.ceil(command.width))
+    if command.tool == 'highlighter':
+        return width + 2  # 平頭筆觸在對角線方向會超出半個筆寬
+    return width // 2 + 2
+
+
+def stroke_step_rect(command: DrawCommand, index: int) -> QRect:
+    """回傳筆劃第 index 個點所產生之線段的影響範圍（含筆寬）。"""
+    points = command.points
+    first = max(0, index - (2 if command.smooth else 1))
+    xs = points[first * 2:index * 2 + 2:2]
+    ys = points[first * 2 + 1:index * 2 + 2:2]
+    left, top = min(xs), min(ys)
+    margin = stroke_margin(command)
+    return QRect(left - margin, top - margin,
+                 max(xs) - left + 1 + 2 * margin, max(ys) - top + 1 + 2 * margin)
+
+
+def points_rect(command: DrawCommand, points) -> QRect:
+    """一串座標 (x0, y0, x1, y1, ...) 加上筆寬邊界後的範圍。"""
+    if not points:
+        return QRect()
+    xs, ys = points[0::2], points[1::2]
+    left, top = min(xs), min(ys)
+    margin = stroke_margin(command)
+    return QRect(left - margin, top - margin,
+                 max(xs) - left + 1 + 2 * margin, max(ys) - top + 1 + 2 * margin)
+
+
+def stroke_bounding_rect(command: DrawCommand) -> QRect:
+    """整筆筆劃的範圍；提交前 command.rect 尚未填入時也能使用。"""
+    return points_rect(command, command.points)
+
+
+def stroke_run_rect(command: DrawCommand, start: int) -> QRect:
+    """從第 start 個點到最後一點所產生之線段的影響範圍 (等同逐點 stroke_step_rect 的聯集)。"""
+    first = max(0, start - (2 if command.smooth else 1))
+    return points_rect(command, command.points[first * 2:])
+
+
+LAYER_GRID = 128  # 暫存圖層範圍對齊的格線 (邏輯像素)
+
+
+def layer_grid_rect(rect: QRect, device_pixel_ratio: float) -> QRect:
+    """
+    暫存圖層的範圍：將 rect 向外對齊到格線，格線間距為 LAYER_GRID 的倍數且落在整數裝置像素上 (例如 DPR 1.25 時為 4 的倍數)。
+    圖層原點在半個裝置像素上會讓合成時重新取樣，而浮點誤差也和原點位置有關；
+    繪製中逐批擴大的圖層與重播時一次配置的圖層都由此決定範圍，原點相同，結果才會逐像素相同。
+    """
+    denominator = Fraction(device_pixel_ratio).limit_denominator(64).denominator
+    step = LAYER_GRID * denominator // math.gcd(LAYER_GRID, denominator)
+    left = rect.left() // step * step
+    top = rect.top() // step * step
+    right = -(-(rect.right() + 1) // step) * step
+    bottom = -(-(rect.bottom() + 1) // step) * step
+    return QRect(left, top, right - left, bottom - top)
+
+
+def new_layer(rect: QRect, device_pixel_ratio: float) -> QImage:
+    """建立涵蓋 rect (邏輯座標) 的透明暫存圖層，以裝置像素配置。"""
+    layer = QImage(rect.size() * device_pixel_ratio, QImage.Format_ARGB32_Premultiplied)
+    layer.setDevicePixelRatio(device_pixel_ratio)
+    layer.fill(Qt.transparent)
+    return layer
+
+
+def _setup_stroke(painter: QPainter, command: DrawCommand, pen: QPen, antialias: bool):
+    painter.setPen(pen)
+    if command.tool == 'eraser':
+        painter.setCompositionMode(QPainter.CompositionMode_Clear)
+    painter.setRenderHint(QPainter.Antialiasing, antialias)
+
+
+def _set_pressure_width(painter: QPainter, pen: QPen, command: DrawCommand, first: int, last: int):
+    """觸控筆筆劃：依第 first 到第 last 個點的壓力調整畫筆寬度 (以 1/32 為一級)，寬度改變時才重設畫筆。"""
+    width = command.width * round(command.extra.width_factor(first, last) * 32) / 32
+    if pen.widthF() != width:
+        pen.setWidthF(width)
+        painter.setPen(pen)
+
+
+def _draw_stroke_segment(painter: QPainter, command: DrawCommand, index: int, antialias: bool, path: QPainterPath,
+                         pen: QPen = None):
+    """畫出第 index 個點所產生的線段；畫筆與合成模式須已設定好 (即時繪製與重播共用)。觸控筆筆劃須傳入目前的畫筆。"""
+    points = command.points
+    i = index * 2
+    if pen is not None and isinstance(command.extra, PenSamples):
+        # 平滑化的曲線以中間的控制點為中心，直線取兩端點的平均壓力
+        previous = max(0, index - 1)
+        _set_pressure_width(painter, pen, command, previous, previous if command.smooth else index)
+    if command.smooth:
+        if index >= 2:
+            x1, y1, x2, y2, x3, y3 = points[i - 4], points[i - 3], points[i - 2], points[i - 1], points[i], points[i + 1]
+            path.clear()
+            path.moveTo((x1 + x2) // 2, (y1 + y2) // 2)
+            path.quadTo(x2, y2, (x2 + x3) // 2, (y2 + y3) // 2)
+            painter.drawPath(path)
+    elif index == 0:
+        # 按下時的第一個點一律反鋸齒，與原本的繪製行為一致
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.drawPoint(points[0], points[1])
+        painter.setRenderHint(QPainter.Antialiasing, antialias)
+    else:
+        painter.drawLine(points[i - 2], points[i - 1], points[i], points[i + 1])
+
+
+def _draw_eraser_batch(painter: QPainter, command: DrawCommand, start: int, end: int, path: QPainterPath):
+    """將第 start 到 end - 1 個點 (連同前一批的最後一點) 連成一條路徑，以一次清除合成擦去。"""
+    points = command.points
+    if end - start == 1 and start == 0:
+        # 按下時的第一個點一律反鋸齒，與手繪筆劃一致
+        antialias = painter.testRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.drawPoint(points[0], points[1])
+        painter.setRenderHint(QPainter.Antialiasing, antialias)
+        return
+    first = max(0, start - 1)
+    path.clear()
+    path.moveTo(points[first * 2], points[first * 2 + 1])
+    for i in range((first + 1) * 2, end * 2, 2):
+        path.lineTo(points[i], points[i + 1])
+    painter.drawPath(path)
+
+
+def finish_stroke(painter: QPainter, command: DrawCommand):
+    """平滑化筆劃在放開滑鼠時補畫不足三個點的短筆劃。"""
+    if not command.smooth:
+        return
+    pen = command_pen(command)
+    painter.setPen(pen)
+    painter.setRenderHint(QPainter.Antialiasing, command.antialias)
+    count = command.point_count()
+    if isinstance(command.extra, PenSamples):
+        _set_pressure_width(painter, pen, command, 0, count - 1)
+    if count == 1:
+        painter.drawPoint(command.point(0))
+    elif count == 2:
+        painter.drawLine(command.point(0), command.point(1))
+
+
+class StrokeSession:
+    """
+    一筆手繪、螢光筆或橡皮擦筆劃從按下到放開之間的繪製狀態。
+    畫筆、合成模式、反鋸齒設定與平滑化用的 QPainterPath 只在開始時建立一次；
+    keep_painter 為 True 時連 QPainter 也沿用到筆劃結束，每個事件只需畫出新增的線段。
+    """
+    __slots__ = ('image', 'command', 'pen', 'keep_painter', 'painter', 'antialias', '_path')
+
+    def __init__(self, image, command: DrawCommand, keep_painter: bool = True):
+        self.image = image
+        self.command = command
+        self.pen = command_pen(command)
+        self.keep_painter = keep_painter
+        self.painter = None
+        self.antialias = command.antialias
+        self._path = QPainterPath()
+
+    def _begin(self, antialias: bool) -> QPainter:
+        if self.painter is None:
+            self.painter = QPainter(self.image)
+            _setup_stroke(self.painter, self.command, self.pen, antialias)
+        elif antialias != self.antialias:
+            self.painter.setRenderHint(QPainter.Antialiasing, antialias)
+        self.antialias = antialias
+        return self.painter
+
+    def add_points(self, points, antialias: bool = None, samples: PenSamples = None) -> QRect:
+        """
+        加入一串座標 (x0, y0, x1, y1, ...) 並畫出新增的線段，回傳畫入的範圍。antialias 可暫時覆寫指令的設定。
+        整串座標一次加入，影響範圍也只計算一次，不必為每個點建立 QPoint 與 QRect。
+        觸控筆筆劃另外傳入與座標一一對應的 samples，加入指令後依壓力決定各段的筆寬。
+        """
+        command = self.command
+        if antialias is None:
+            antialias = command.antialias
+        painter = self._begin(antialias)
+        start = command.point_count()
+        command.add_points(points)
+        if samples is not None and isinstance(command.extra, PenSamples):
+            command.extra.extend(samples)
+        path, pen = self._path, self.pen
+        for index in range(start, command.point_count()):
+            _draw_stroke_segment(painter, command, index, antialias, path, pen)
+        if not self.keep_painter:
+            self.release_painter()
+        return stroke_run_rect(command, start)
+
+    def finish(self) -> QRect:
+        """放開滑鼠時呼叫：補畫平滑化的短筆劃並結束 QPainter，回傳補畫的範圍。"""
+        command = self.command
+        update_rect = QRect()
+        if command.smooth and command.point_count() <= 2:
+            finish_stroke(self._begin(command.antialias), command)
+            update_rect = stroke_step_rect(command, command.point_count() - 1)
+        self.release_painter()
+        return update_rect
+
+    def release_painter(self):
+        """結束目前的 QPainter；其他程式碼要在筆劃進行中讀寫同一張圖層前呼叫，下一批座標會重新建立。"""
+        if self.painter is not None:
+            self.painter.end()
+            self.painter = None
+
+    def set_target(self, image):
+        """筆劃進行中筆跡圖層重新配置 (例如視窗大小改變) 時呼叫，之後的線段畫入新的圖層。"""
+        self.release_painter()
+        self.image = image
+
+
+class EraserSession(StrokeSession):
+    """
+    橡皮擦筆劃：每一批座標 (通常是一個畫面內累積的移動事件) 連成一條路徑，以一次清除合成擦去，
+    不必逐段畫線。每批結束時的點數記錄在 command.extra，重播時依相同的分段畫出，結果與繪製時一致。
+    """
+    __slots__ = ()
+
+    def __init__(self, image, command: DrawCommand, keep_painter: bool = True):
+        super().__init__(image, command, keep_painter)
+        command.extra = array('i')
+
+    def add_points(self, points, antialias: bool = None, samples: PenSamples = None) -> QRect:
+        command = self.command
+        if antialias is None:
+            antialias = command.antialias
+        painter = self._begin(antialias)
+        start = command.point_count()
+        command.add_points(points)
+        end = command.point_count()
+        command.extra.append(end)
+        _draw_eraser_batch(painter, command, start, end, self._path)
+        if not self.keep_painter:
+            self.release_painter()
+        # 重繪與復原紀錄的範圍為整條路徑 (含上一批的最後一點) 的外框
+        return stroke_run_rect(command, start)
+
+
+class HighlighterSession(StrokeSession):
+    """
+    螢光筆筆劃：線段以不透明的顏色畫進只涵蓋筆劃範圍的暫存圖層，放開時以指令顏色的透明度一次合成到筆跡圖層，
+    同一筆劃中重疊的線段不會越疊越深。暫存圖層隨筆劃範圍擴大，記憶體只和筆劃大小有關；
+    繪製中由視窗以 paint_layer() 顯示，只需要重繪新線段的範圍。
+    """
+    __slots__ = ('target', 'layer_rect')
+
+    def __init__(self, image, command: DrawCommand, keep_painter: bool = True):
+        super().__init__(None, command, keep_painter)
+        self.target = image
+        self.layer_rect = QRect()
+
+    def _begin(self, antialias: bool) -> QPainter:
+        created = self.painter is None
+        painter = super()._begin(antialias)
+        if created:
+            painter.translate(-self.layer_rect.x(), -self.layer_rect.y())
+        return painter
+
+    def _ensure_layer(self, rect: QRect):
+        """確保暫存圖層涵蓋 rect；不足時配置較大的圖層 (以格線為單位擴大，不必每一批座標都重新配置) 並複製已畫好的內容。"""
+        if self.layer_rect.contains(rect):
+            return
+        dpr = self.target.devicePixelRatio()
+        new_rect = layer_grid_rect(rect.united(self.layer_rect), dpr)
+        layer = new_layer(new_rect, dpr)
+        if self.image is not None:
+            self.release_painter()
+            painter = QPainter(layer)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawImage(self.layer_rect.topLeft() - new_rect.topLeft(), self.image)
+            painter.end()
+        self.image = layer
+        self.layer_rect = new_rect
+
+    def set_target(self, image):
+        """只更換放開時合成的筆跡圖層；暫存圖層與已畫好的線段保持不變。"""
+        self.target = image
+
+    def add_points(self, points, antialias: bool = None, samples: PenSamples = None) -> QRect:
+        self._ensure_layer(points_rect(self.command, points))
+        return super().add_points(points, antialias, samples)
+
+    def finish(self) -> QRect:
+        """補畫短筆劃後將整筆以一致的透明度合成到筆跡圖層，回傳合成的範圍。"""
+        if self.image is None:
+            return QRect()
+        super().finish()
+        painter = QPainter(self.target)
+        self.paint_layer(painter)
+        painter.end()
+        rect = stroke_bounding_rect(self.command)
+        self.image = None
+        return rect
+
+    def paint_layer(self, painter: QPainter):
+        """以指令顏色的透明度畫出暫存圖層 (合成時與繪製中顯示時共用)。"""
+        if self.image is None:
+            return
+        painter.save()
+        painter.setOpacity(self.command.color().alphaF())
+        painter.drawImage(self.layer_rect.topLeft(), self.image)
+        painter.restore()
+
+
+def _render_highlighter(painter: QPainter, command: DrawCommand):
+    """重播螢光筆筆劃：與 HighlighterSession 相同，先畫進暫存圖層再以一致的透明度合成。"""
+    rect = stroke_bounding_rect(command)
+    if rect.isEmpty():
+        return
+    dpr = painter.device().devicePixelRatioF()
+    rect = layer_grid_rect(rect, dpr)
+    layer = new_layer(rect, dpr)
+    layer_painter = QPainter(layer)
+    layer_painter.translate(-rect.x(), -rect.y())
+    path = QPainterPath()
+    _setup_stroke(layer_painter, command, command_pen(command), command.antialias)
+    for index in range(command.point_count()):
+        _draw_stroke_segment(layer_painter, command, index, command.antialias, path)
+    finish_stroke(layer_painter, command)
+    layer_painter.end()
+    painter.setOpacity(command.color().alphaF())
+    painter.drawImage(rect.topLeft(), layer)
+
+
+def _render_eraser(painter: QPainter, command: DrawCommand):
+    """重播橡皮擦筆劃：依繪製時的分段 (command.extra) 畫出各條路徑；沒有分段紀錄時整筆當作一條路徑。"""
+    count = command.point_count()
+    if not count:
+        return
+    _setup_stroke(painter, command, command_pen(command), command.antialias)
+    path = QPainterPath()
+    start = 0
+    for end in (command.extra or (count,)):
+        _draw_eraser_batch(painter, command, start, end, path)
+        start = end
+
+
+def arrow_head_points(start_point: QPoint, end_point: QPoint, arrow_size: float):
+    """回傳箭頭兩側端點；起點與終點重合時回傳 None。"""
+    line = end_point - start_point
+    if line.isNull(): return None
+    angle = math.atan2(-line.y(), line.x())
+    arrow_p1 = end_point - QPoint(int(math.cos(angle + math.pi / 6) * arrow_size), int(-math.sin(angle + math.pi / 6) * arrow_size))
+    arrow_p2 = end_point - QPoint(int(math.cos(angle - math.pi / 6) * arrow_size), int(-math.sin(angle - math.pi / 6) * arrow_size))
+    return arrow_p1, arrow_p2
+
+
+def draw_arrow(painter: QPainter, start_point: QPoint, end_point: QPoint, arrow_size: float):
+    head = arrow_head_points(start_point, end_point, arrow_size)
+    if head is None: return
+    painter.drawLine(start_point, end_point)
+    painter.drawLine(end_point, head[0])
+    painter.drawLine(end_point, head[1])
+
+
+def draw_shape(painter: QPainter, command: DrawCommand):
+    painter.setRenderHint(QPainter.Antialiasing, command.antialias)
+    painter.setPen(command_pen(command))
+    start_point, end_point = command.point(0), command.point(1)
+    if command.tool == 'line':
+        painter.drawLine(start_point, end_point)
+    elif command.tool == 'arrow':
+        draw_arrow(painter, start_point, end_point, command.extra)
+    elif command.tool == 'rectangle':
+        painter.drawRect(QRect(start_point, end_point).normalized())
+    elif command.tool == 'circle':
+        rx, ry = command.extra
+        painter.drawEllipse(start_point, rx, ry)
+
+
+def text_line_height(font: QFont) -> int:
+    """多行文字的行距；編輯中的文字方塊與提交後的文字共用，確保兩者的位置一致。"""
+    return math.ceil(QFontMetricsF(font).height())
+
+
+@lru_cache(maxsize=512)
+def static_text_lines(text: str, font_description: str) -> tuple:
+    """
+    將文字指令的每一行排版成 QStaticText 並快取 (QStaticText 不會把換行當成斷行，因此一行一個)。
+    重播復原紀錄或再次畫出同一段文字時直接使用排版好的字形位置，不必重新排版。
+    """
+    font = QFont()
+    font.fromString(font_description)
+    lines = []
+    for line in text.split('\n'):
+        static_text = QStaticText(line)
+        static_text.setTextFormat(Qt.PlainText)
+        static_text.prepare(QTransform(), font)
+        lines.append(static_text)
+    return font, tuple(lines)
+
+
+def draw_text(painter: QPainter, command: DrawCommand):
+    text, font_description, rect = command.extra
+    font, lines = static_text_lines(text, font_description)
+    painter.setRenderHint(QPainter.Antialiasing, command.antialias)
+    painter.setPen(command.color())
+    painter.setFont(font)
+    line_height = text_line_height(font)
+    for row, static_text in enumerate(lines):
+        painter.drawStaticText(QPointF(rect[0], rect[1] + row * line_height), static_text)
+
+
+def render_command(painter: QPainter, command: DrawCommand):
+    """將一筆完整指令重播到 painter 上。"""
+    painter.save()
+    if command.tool == 'highlighter':
+        _render_highlighter(painter, command)
+    elif command.tool == 'eraser':
+        _render_eraser(painter, command)
+    elif command.tool in STROKE_TOOLS:
+        path = QPainterPath()
+        pen = command_pen(command)
+        _setup_stroke(painter, command, pen, command.antialias)
+        for index in range(command.point_count()):
+            _draw_stroke_segment(painter, command, index, command.antialias, path, pen)
+        finish_stroke(painter, command)
+    elif command.tool in SHAPE_TOOLS:
+        draw_shape(painter, command)
+    elif command.tool == 'text':
+        draw_text(painter, command)
+    elif command.tool == 'clear':
+        device = painter.device()
+        painter.setCompositionMode(QPainter.CompositionMode_Clear)
+        painter.fillRect(QRect(0, 0, device.width(), device.height()), Qt.transparent)
+    painter.restore()
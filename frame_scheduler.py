@@ -0,0 +1,106 @@
+import logging
+from array import array
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QRegion
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FRAME_RATES = (60, 120, 144)
+
+
+def nearest_frame_rate(refresh_rate: float) -> int:
+    """將螢幕回報的更新率對應到最接近的支援值（例如 59.94 Hz -> 60 Hz）。"""
+    if refresh_rate <= 0:
+        return SUPPORTED_FRAME_RATES[0]
+    return min(SUPPORTED_FRAME_RATES, key=lambda rate: abs(rate - refresh_rate))
+
+
+class FrameScheduler(QObject):
+    """
+    輸入與重繪之間的畫面節拍器。
+    高回報率的滑鼠/觸控筆每秒會送出上千個移動事件，但螢幕每秒只能顯示 60~144 張畫面；
+    事件處理只把座標放進佇列 (array('i') 的 x0, y0, x1, y1, ...)、把需要重繪的範圍併入 pending 區域，
+    由依更新率觸發的計時器在每個畫面一次處理整批座標，並只呼叫一次 update()。
+    """
+    frame_flushed = pyqtSignal(int)  # 這個畫面合併了幾個輸入事件
+
+    def __init__(self, widget, flush_points, frame_rate: int = 60):
+        super().__init__(widget)
+        self._widget = widget
+        self._flush_points = flush_points  # callable(array('i')) -> QRect，回傳畫入的範圍
+        self._pending_points = array('i')
+        self._pending_region = QRegion()
+        self._pending_events = 0
+        self.frame_rate = 0
+        self.frames = 0                # 實際送出的畫面數
+        self.merged_events = 0         # 累計合併的輸入事件數
+        self.last_merged_events = 0
+        self.max_merged_events = 0
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self.flush)
+        self.set_frame_rate(frame_rate)
+
+    def set_frame_rate(self, frame_rate: int):
+        self.frame_rate = max(1, int(frame_rate))
+        self._timer.setInterval(max(1, round(1000 / self.frame_rate)))
+
+    def note_event(self):
+        """記錄一個會排入座標或重繪範圍的輸入事件；同一個畫面內的事件數即為合併數。"""
+        self._pending_events += 1
+
+    def queue_point(self, point):
+        """將筆劃的新座標放進佇列，留待下一個畫面一次畫入。"""
+        self._pending_points.append(point.x())
+        self._pending_points.append(point.y())
+        self._schedule()
+
+    def invalidate(self, area):
+        """將 area (QRect 或 QRegion) 併入下一個畫面的重繪區域。"""
+        if not area.isEmpty():
+            self._pending_region = self._pending_region.united(area)
+            self._schedule()
+
+    def has_pending(self) -> bool:
+        return bool(self._pending_points) or not self._pending_region.isEmpty()
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """處理目前累積的座標與重繪區域；放開滑鼠等需要立即結算的時機也會直接呼叫。"""
+        points, region, events = self._pending_points, self._pending_region, self._pending_events
+        self._pending_points = array('i')
+        self._pending_region = QRegion()
+        self._pending_events = 0
+
+        if points:
+            region = region.united(self._flush_points(points))
+        if not region.isEmpty():
+            self._widget.update(region)
+
+        if events:
+            self.frames += 1
+            self.merged_events += events
+            self.last_merged_events = events
+            self.max_merged_events = max(self.max_merged_events, events)
+            logger.debug("Frame %d merged %d input events (%d points)", self.frames, events, len(points) // 2)
+            self.frame_flushed.emit(events)
+        elif region.isEmpty():
+            # 一整個畫面都沒有新的輸入，停止計時器直到下一個事件
+            self._timer.stop()
+
+    def stats(self) -> dict:
+        """回傳合併統計，方便記錄或比較不同更新率的效果。"""
+        return {
+            'frame_rate': self.frame_rate,
+            'frames': self.frames,
+            'merged_events': self.merged_events,
+            'average': self.merged_events / self.frames if self.frames else 0.0,
+            'last': self.last_merged_events,
+            'max': self.max_merged_events,
+        }
+
+    def reset_stats(self):
+        self.frames = self.merged_events = self.last_merged_events = self.max_merged_events = 0
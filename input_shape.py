@@ -0,0 +1,98 @@
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QColor, QImage, QRegion
+
+from canvas_history import logical_rect, device_rect
+
+INK_CELL_SIZE = 64
+PASS_THROUGH_OUTLINE_COLOR = QColor(0, 170, 120)  # 穿透區域的虛線框與框選預覽
+
+
+def rects_from_setting(value) -> list:
+    """QSettings 讀回的矩形清單可能是 None、單一 QRect 或 QRect 的 list。"""
+    if value is None:
+        return []
+    if isinstance(value, QRect):
+        return [value] if not value.isEmpty() else []
+    return [rect for rect in value if isinstance(rect, QRect) and not rect.isEmpty()]
+
+
+class InkRegionTracker:
+    """
+    以固定大小的格子記錄筆跡圖層中哪些地方有筆跡，合併成 QRegion 供視窗外形使用。
+    新增筆劃時只把影響範圍內的格子標記為有筆跡；擦除、復原或重做時才檢查範圍內格子的像素，
+    因此更新成本只和改變的範圍有關，不必每次掃描整個畫面。
+    """
+    def __init__(self, cell_size: int = INK_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = set()
+        self._region = QRegion()
+        self._region_valid = True
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def _cells_in(self, rect: QRect, bounds: QRect):
+        rect = rect.normalized().intersected(bounds)
+        if rect.isEmpty():
+            return
+        size = self.cell_size
+        for cy in range(rect.top() // size, rect.bottom() // size + 1):
+            for cx in range(rect.left() // size, rect.right() // size + 1):
+                yield (cx, cy)
+
+    def _cell_rect(self, cell, bounds: QRect) -> QRect:
+        cx, cy = cell
+        return QRect(cx * self.cell_size, cy * self.cell_size, self.cell_size, self.cell_size).intersected(bounds)
+
+    def add(self, image: QImage, rect: QRect) -> bool:
+        """rect 內畫入了筆跡；回傳有筆跡的範圍是否變大。"""
+        new_cells = set(self._cells_in(rect, logical_rect(image))) - self._cells
+        if not new_cells:
+            return False
+        self._cells |= new_cells
+        if self._region_valid:
+            for cell in new_cells:
+                self._region = self._region.united(self._cell_rect(cell, logical_rect(image)))
+        return True
+
+    def rescan(self, image: QImage, rect: QRect) -> bool:
+        """重新檢查 rect 內每個格子是否仍有不透明的像素 (擦除或復原後呼叫)；回傳範圍是否改變。"""
+        bounds = logical_rect(image)
+        dpr = image.devicePixelRatio()
+        changed = False
+        for cell in self._cells_in(rect, bounds):
+            inked = self._cell_has_ink(image, device_rect(self._cell_rect(cell, bounds), dpr))
+            if inked != (cell in self._cells):
+                changed = True
+                if inked:
+                    self._cells.add(cell)
+                else:
+                    self._cells.discard(cell)
+        if changed:
+            self._region_valid = False  # 移除格子無法從 QRegion 逐一扣除得很有效率，下次取用時重建
+        return changed
+
+    def reset(self, image: QImage = None):
+        """清除所有紀錄；指定 image 時重新掃描整張圖層 (切換模式或載入筆跡時使用)。"""
+        self._cells.clear()
+        self._region = QRegion()
+        self._region_valid = True
+        if image is not None and not image.isNull():
+            self.rescan(image, logical_rect(image))
+
+    def region(self, bounds: QRect) -> QRegion:
+        if not self._region_valid:
+            region = QRegion()
+            for cell in self._cells:
+                region = region.united(self._cell_rect(cell, bounds))
+            self._region = region
+            self._region_valid = True
+        return self._region
+
+    @staticmethod
+    def _cell_has_ink(image: QImage, rect: QRect) -> bool:
+        cell = image.copy(rect)
+        bits = cell.constBits()
+        bits.setsize(cell.sizeInBytes())
+        # premultiplied ARGB：完全透明的像素四個位元組都是 0
+        return bool(bytes(bits).strip(b"\0"))
@@ -0,0 +1,72 @@
+from array import array
+from PyQt5.QtCore import QRect
+
+
+class LaserTrail:
+    """
+    雷射筆軌跡的固定容量環狀緩衝區。
+    每一段線段的座標與產生時間存在 array 中，透明度在繪製時依經過的時間計算，
+    因此淡出不需要每個計時器週期重建清單；容量用完時覆寫最舊的線段，長時間使用也只佔固定記憶體。
+    """
+    def __init__(self, capacity: int = 512, lifetime_ms: float = 510.0):
+        self.capacity = capacity
+        self.lifetime = lifetime_ms / 1000.0
+        self._coords = array('i', bytes(4 * 4 * capacity))  # 每段 x1, y1, x2, y2
+        self._times = array('d', bytes(8 * capacity))
+        self._head = 0   # 最舊線段的位置
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def add_run(self, x: int, y: int, points, timestamp: float):
+        """加入從 (x, y) 依序連到 points (x0, y0, x1, y1, ...) 各點的線段，同一批線段共用一個時間。"""
+        for i in range(0, len(points), 2):
+            nx, ny = points[i], points[i + 1]
+            if self._count < self.capacity:
+                slot = (self._head + self._count) % self.capacity
+                self._count += 1
+            else:
+                slot = self._head
+                self._head = (self._head + 1) % self.capacity
+            j = slot * 4
+            self._coords[j] = x
+            self._coords[j + 1] = y
+            self._coords[j + 2] = nx
+            self._coords[j + 3] = ny
+            self._times[slot] = timestamp
+            x, y = nx, ny
+
+    def prune(self, now: float):
+        """移除已完全淡出的線段。"""
+        while self._count and now - self._times[self._head] >= self.lifetime:
+            self._head = (self._head + 1) % self.capacity
+            self._count -= 1
+
+    def segments(self, now: float):
+        """
+        由舊到新產生 (x1, y1, x2, y2, life)；life 為剩餘壽命的比例 1 - (now - t) / lifetime，
+        由 1 線性遞減到 0。透明度與粗細都依 life 計算，淡出速度只和時間有關，與移動速度或事件頻率無關。
+        """
+        coords, times, lifetime = self._coords, self._times, self.lifetime
+        for n in range(self._count):
+            slot = (self._head + n) % self.capacity
+            life = 1.0 - (now - times[slot]) / lifetime
+            i = slot * 4
+            yield coords[i], coords[i + 1], coords[i + 2], coords[i + 3], min(1.0, max(0.0, life))
+
+    def bounding_rect(self, margin: int) -> QRect:
+        """所有線段的外框 (含 margin)；沒有線段時回傳空的 QRect。"""
+        if not self._count:
+            return QRect()
+        coords = self._coords
+        slots = [(self._head + n) % self.capacity * 4 for n in range(self._count)]
+        xs = [coords[i + k] for i in slots for k in (0, 2)]
+        ys = [coords[i + k] for i in slots for k in (1, 3)]
+        left, top = min(xs), min(ys)
+        return QRect(left - margin, top - margin,
+                     max(xs) - left + 1 + 2 * margin, max(ys) - top + 1 + 2 * margin)
@@ -30,7 +30,7 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
 from PyQt5.QtCore import Qt, QTimer, QPoint, QSize, QPropertyAnimation, QEasingCurve, QSettings # 引入動畫相關工具和設定
 from PyQt5.QtGui import QPainter, QColor, QBrush # 引入繪圖相關工具
 
-from screen_draw import ScreenDrawWindow # 匯入實際的螢幕畫記視窗
+from screen_canvases import ScreenCanvasGroup # 每個螢幕一個畫記視窗
 from timer import TimerWidget
 # from volume_monitor import VolumeMonitorWidget # 移除音量監測工具
 from random_picker import RandomPickerWidget # 匯入實際的抽籤工具
@@ -234,6 +234,9 @@ class MainToolBar(QWidget):
         pass # 移除音量監測後，此處無需操作
         # 2. 執行緒關閉後，再儲存所有設定
         self.save_all_settings()
+        # 3. 設定儲存後再釋放畫記視窗的背景執行緒與休眠暫存檔
+        if self.draw_window is not None:
+            self.draw_window.shutdown()
 
     def save_all_settings(self):
         """在應用程式關閉前，儲存所有需要持久化的設定。"""
@@ -324,7 +327,7 @@ class MainToolBar(QWidget):
     def toggle_drawing(self):
         # 螢幕畫記視窗比較特殊，通常是全螢幕的
         if self.draw_window is None:
-            self.draw_window = ScreenDrawWindow()
+            self.draw_window = ScreenCanvasGroup()
             # 連接畫記視窗的信號，以便在畫記模式從畫記視窗內部結束時更新主工具列的狀態
             self.draw_window.drawing_mode_ended.connect(self.on_drawing_mode_ended)
             # 新增：連接畫布點擊信號，以確保工具列保持在最上層
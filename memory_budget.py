@@ -0,0 +1,100 @@
+import logging
+from PyQt5.QtGui import QPixmap, QImage
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def image_nbytes(image) -> int:
+    """回傳 QPixmap 或 QImage 所佔用的位元組數；None 或空影像回傳 0。"""
+    if image is None or image.isNull():
+        return 0
+    if isinstance(image, QImage):
+        return image.sizeInBytes()
+    if isinstance(image, QPixmap):
+        return image.width() * image.height() * image.depth() // 8
+    return 0
+
+
+class PixmapMemoryRegistry:
+    """
+    應用程式層級的大型點陣緩衝區登記表。
+    各視窗登記自己持有的 QPixmap/QImage（或回報動態大小的函式），
+    總用量超過上限時，依登記順序執行釋放策略，直到回到上限以下。
+    """
+    _instance = None
+
+    @classmethod
+    def instance(cls) -> 'PixmapMemoryRegistry':
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.ceiling_bytes = 0  # 0 代表不限制
+        self._buffers = {}      # {(owner_id, name): bytes}
+        self._providers = {}    # {(owner_id, name): callable -> bytes}
+        self._policies = []     # [(owner_id, name, callable)]
+        self._enforcing = False
+
+    def track(self, owner, name: str, image):
+        """登記 (或更新) owner 持有的一個影像緩衝區；image 為 None 時移除。"""
+        self.track_bytes(owner, name, image_nbytes(image))
+
+    def track_bytes(self, owner, name: str, nbytes: int):
+        key = (id(owner), name)
+        previous = self._buffers.get(key, 0)
+        if nbytes:
+            self._buffers[key] = nbytes
+        else:
+            self._buffers.pop(key, None)
+        if nbytes != previous:
+            logger.debug("%s.%s: %.1f MB (total %.1f MB)", type(owner).__name__, name, nbytes / MB, self.total_bytes() / MB)
+        self.enforce()
+
+    def register_provider(self, owner, name: str, provider):
+        """登記一個會回報目前位元組數的函式，例如復原紀錄的 total_bytes。"""
+        self._providers[(id(owner), name)] = provider
+
+    def add_policy(self, owner, name: str, policy):
+        """登記釋放策略；超過上限時會依登記順序呼叫。"""
+        self._policies.append((id(owner), name, policy))
+
+    def release(self, owner):
+        """移除 owner 登記的所有緩衝區、動態來源與策略。"""
+        owner_id = id(owner)
+        self._buffers = {key: value for key, value in self._buffers.items() if key[0] != owner_id}
+        self._providers = {key: value for key, value in self._providers.items() if key[0] != owner_id}
+        self._policies = [entry for entry in self._policies if entry[0] != owner_id]
+
+    def breakdown(self) -> dict:
+        """回傳 {名稱: 位元組數}，方便記錄或顯示目前的用量分布。"""
+        result = {}
+        for (_, name), nbytes in self._buffers.items():
+            result[name] = result.get(name, 0) + nbytes
+        for (_, name), provider in self._providers.items():
+            result[name] = result.get(name, 0) + provider()
+        return result
+
+    def total_bytes(self) -> int:
+        return sum(self._buffers.values()) + sum(provider() for provider in self._providers.values())
+
+    def enforce(self):
+        """總用量超過上限時，依序套用釋放策略。"""
+        if self._enforcing or self.ceiling_bytes <= 0:
+            return
+        total = self.total_bytes()
+        if total <= self.ceiling_bytes:
+            return
+        self._enforcing = True
+        try:
+            logger.warning("Pixmap memory %.1f MB exceeds ceiling %.1f MB", total / MB, self.ceiling_bytes / MB)
+            for _, name, policy in list(self._policies):
+                policy()
+                total = self.total_bytes()
+                logger.info("Applied memory policy '%s': total now %.1f MB", name, total / MB)
+                if total <= self.ceiling_bytes:
+                    break
+        finally:
+            self._enforcing = False
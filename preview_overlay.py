@@ -0,0 +1,93 @@
+import math
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect, QRectF
+from PyQt5.QtGui import QPainter, QPainterPath, QPen, QRegion
+
+from draw_commands import arrow_head_points
+
+PREVIEW_TOOLS = ('line', 'arrow', 'rectangle', 'circle', 'crop', 'pass_through')
+
+
+def shape_path(tool: str, start_point: QPoint, end_point: QPoint, shift: bool = False, arrow_size: float = 0.0) -> QPainterPath:
+    """回傳拉線預覽的外形；圓形以起點為圓心，按住 Shift 時為正圓。"""
+    path = QPainterPath()
+    if tool == 'line':
+        path.moveTo(QPointF(start_point))
+        path.lineTo(QPointF(end_point))
+    elif tool == 'arrow':
+        head = arrow_head_points(start_point, end_point, arrow_size)
+        path.moveTo(QPointF(start_point))
+        path.lineTo(QPointF(end_point))
+        if head is not None:
+            for point in head:
+                path.moveTo(QPointF(end_point))
+                path.lineTo(QPointF(point))
+    elif tool in ('rectangle', 'crop', 'pass_through'):
+        path.addRect(QRectF(QRect(start_point, end_point).normalized()))
+    elif tool == 'circle':
+        dx, dy = end_point.x() - start_point.x(), end_point.y() - start_point.y()
+        if shift:
+            rx = ry = math.hypot(dx, dy)
+        else:
+            rx, ry = abs(dx), abs(dy)
+        path.addEllipse(QPointF(start_point), rx, ry)
+    return path
+
+
+def outline_region(path: QPainterPath, margin: int, chunk: float = 32.0) -> QRegion:
+    """
+    以沿著外形排列的小矩形涵蓋線條本身 (而非整個外框)，
+    拖曳大圓或長對角線時只需要重繪線條經過的像素。
+    """
+    region = QRegion()
+    for polygon in path.toSubpathPolygons():
+        for i in range(polygon.count() - 1):
+            a, b = polygon.at(i), polygon.at(i + 1)
+            steps = int(math.hypot(b.x() - a.x(), b.y() - a.y()) // chunk) + 1
+            for k in range(steps):
+                p = a + (b - a) * (k / steps)
+                q = a + (b - a) * ((k + 1) / steps)
+                rect = QRectF(p, q).normalized().toAlignedRect()
+                region = region.united(rect.adjusted(-margin, -margin, margin, margin))
+    return region
+
+
+class PreviewOverlay:
+    """
+    直線、箭頭、矩形、圓形與選取範圍在拖曳時的預覽圖層。
+    只保存預覽的外形與畫筆，不會修改背景或筆跡圖層；
+    每次更新回傳新舊預覽線條所涵蓋的區域，讓視窗只重繪這些像素。
+    """
+    def __init__(self):
+        self.path = QPainterPath()
+        self.pen = QPen()
+        self.region = QRegion()
+
+    def is_active(self) -> bool:
+        return not self.region.isEmpty()
+
+    def set_shape(self, tool: str, start_point: QPoint, end_point: QPoint, pen: QPen,
+                  shift: bool = False, arrow_size: float = 0.0) -> QRegion:
+        """更新預覽外形，回傳需要重繪的區域 (舊預覽 + 新預覽)。"""
+        previous_region = self.region
+        self.path = shape_path(tool, start_point, end_point, shift, arrow_size)
+        self.pen = pen
+        margin = int(math.ceil(pen.widthF() / 2)) + 2
+        self.region = outline_region(self.path, margin)
+        return previous_region.united(self.region)
+
+    def clear(self) -> QRegion:
+        """移除預覽，回傳需要重繪的區域。"""
+        previous_region = self.region
+        self.path = QPainterPath()
+        self.region = QRegion()
+        return previous_region
+
+    def paint(self, painter: QPainter):
+        if not self.is_active():
+            return
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(self.pen)
+        painter.setBrush(Qt.NoBrush)
+        painter.drawPath(self.path)
+        painter.restore()
@@ -0,0 +1,74 @@
+import logging
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+# 品質等級：數字越大，省略的效果越多 (每一級都包含前一級的降級)
+QUALITY_FULL = 0
+QUALITY_FAST_BLIT = 1      # 背景複製不使用平滑縮放
+QUALITY_FAST_STROKE = 2    # 繪製中的筆劃不反鋸齒
+QUALITY_FAST_LASER = 3     # 雷射筆以較少的粗細階數、不反鋸齒繪製
+QUALITY_LOWEST = QUALITY_FAST_LASER
+
+
+class QualityGovernor(QObject):
+    """
+    依實際量測到的每個畫面繪製時間調整繪圖品質。
+    連續 degrade_after 個畫面超過 budget_ms 時降低一級；
+    筆劃提交時或閒置 idle_ms 後恢復完整品質，讓舊電腦在書寫時筆跡仍能跟上筆尖。
+    """
+    level_changed = pyqtSignal(int)
+
+    def __init__(self, parent=None, budget_ms: float = 16.0, degrade_after: int = 3, idle_ms: int = 300):
+        super().__init__(parent)
+        self.budget_ms = budget_ms
+        self.degrade_after = degrade_after
+        self.level = QUALITY_FULL
+        self.last_frame_ms = 0.0
+        self.average_frame_ms = 0.0
+        self._over_budget_frames = 0
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.setInterval(idle_ms)
+        self._idle_timer.timeout.connect(self.restore)
+
+    def frame_rendered(self, frame_ms: float):
+        """回報一個畫面 (畫入筆跡 + 重繪) 所花費的時間。"""
+        self.last_frame_ms = frame_ms
+        self.average_frame_ms = frame_ms if not self.average_frame_ms else self.average_frame_ms * 0.8 + frame_ms * 0.2
+        if frame_ms > self.budget_ms:
+            self._over_budget_frames += 1
+            if self._over_budget_frames >= self.degrade_after and self.level < QUALITY_LOWEST:
+                self._over_budget_frames = 0
+                self._set_level(self.level + 1)
+        else:
+            self._over_budget_frames = 0
+        if self.level != QUALITY_FULL:
+            self._idle_timer.start()
+
+    def restore(self):
+        """恢復完整品質。"""
+        self._idle_timer.stop()
+        self._over_budget_frames = 0
+        self._set_level(QUALITY_FULL)
+
+    def _set_level(self, level: int):
+        if level == self.level:
+            return
+        logger.info("Rendering quality %d -> %d (frame %.1f ms, average %.1f ms, budget %.1f ms)",
+                    self.level, level, self.last_frame_ms, self.average_frame_ms, self.budget_ms)
+        self.level = level
+        self.level_changed.emit(level)
+
+    def smooth_blits(self) -> bool:
+        return self.level < QUALITY_FAST_BLIT
+
+    def antialias_strokes(self) -> bool:
+        return self.level < QUALITY_FAST_STROKE
+
+    def antialias_laser(self) -> bool:
+        return self.level < QUALITY_FAST_LASER
+
+    def laser_taper_steps(self) -> int:
+        """雷射筆依經過時間漸細的粗細級數；降級時減少粗細變化以便合併繪製。"""
+        return 15 if self.level < QUALITY_FAST_LASER else 3
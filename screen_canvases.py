@@ -0,0 +1,134 @@
+from functools import partial
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+from screen_draw import ScreenDrawWindow
+
+
+class ScreenCanvasGroup(QObject):
+    """
+    每個螢幕 (QScreen) 各有一個畫記視窗，例如筆電螢幕加上投影機。
+    每個畫布的大小、DPR 與桌面截圖都取自自己的螢幕，筆跡圖層則在第一次於該螢幕畫記時才配置，
+    因此記憶體只隨實際畫記過的螢幕增加。
+
+    主螢幕的畫布擁有工具列，其他畫布共用同一個工具列：工具、顏色與粗細等狀態同時套用到所有畫布，
+    復原、清除、儲存與更換背景等動作只作用在最近一次點擊的畫布上。
+    對外提供與 ScreenDrawWindow 相同的 toggle_drawing_mode / end_drawing_mode 介面與信號。
+    """
+    drawing_mode_ended = pyqtSignal()
+    canvas_activated = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        app = QApplication.instance()
+        self.primary = ScreenDrawWindow(app.primaryScreen(), toolbar_actions=False)
+        self.canvases = [self.primary]
+        self.active_canvas = self.primary
+        self._drawing_mode = False
+        self._watch_canvas(self.primary)
+        self._connect_toolbar_actions(self.primary.toolbar)
+        for screen in app.screens():
+            if screen is not app.primaryScreen():
+                self._add_screen(screen)
+        app.screenAdded.connect(self._add_screen)
+        app.screenRemoved.connect(self._remove_screen)
+        app.primaryScreenChanged.connect(self._follow_primary_screen)
+
+    def _connect_toolbar_actions(self, toolbar):
+        toolbar.undo_requested.connect(partial(self._dispatch, 'undo'))
+        toolbar.redo_requested.connect(partial(self._dispatch, 'redo'))
+        toolbar.clear_requested.connect(partial(self._dispatch, 'clear_screen'))
+        toolbar.save_requested.connect(partial(self._dispatch, 'handle_save_action'))
+        toolbar.canvas_changed.connect(partial(self._dispatch, 'handle_canvas_change'))
+        toolbar.exit_requested.connect(self.end_drawing_mode)
+        toolbar.toolbar_activated.connect(self.canvas_activated.emit)
+
+    def _dispatch(self, method: str, *args):
+        getattr(self.active_canvas, method)(*args)
+
+    def _watch_canvas(self, canvas: ScreenDrawWindow):
+        canvas.canvas_activated.connect(partial(self._activate, canvas))
+        canvas.drawing_mode_ended.connect(self._handle_canvas_ended)
+
+    def _activate(self, canvas: ScreenDrawWindow):
+        if canvas is not self.active_canvas:
+            self.active_canvas.toolbar_active = False
+            self.active_canvas = canvas
+            canvas.toolbar_active = True
+            canvas._update_undo_redo_buttons() # 工具列的復原/重做按鈕反映使用中的畫布
+        self.canvas_activated.emit()
+
+    def _add_screen(self, screen):
+        canvas = ScreenDrawWindow(screen, toolbar=self.primary.toolbar, toolbar_actions=False)
+        self._watch_canvas(canvas)
+        self.canvases.append(canvas)
+        if self._drawing_mode:
+            canvas.toggle_drawing_mode(True)
+
+    def _remove_screen(self, screen):
+        if self.primary.target_screen is screen:
+            self._promote_primary(screen)
+        for canvas in self.canvases[1:]:
+            if canvas.target_screen is screen:
+                self.canvases.remove(canvas)
+                if canvas is self.active_canvas:
+                    self._activate(self.primary)
+                canvas.toggle_drawing_mode(False)
+                # 停止背景執行緒、刪除暫存檔並從記憶體登記表移除，否則畫布無法回收
+                canvas.shutdown()
+                canvas.deleteLater()
+                return
+
+    def _promote_primary(self, removed_screen):
+        """主畫布所在的螢幕被移除時，改由新主螢幕上的畫布擁有工具列，原本的主畫布則和一般畫布一樣移除。"""
+        app = QApplication.instance()
+        screens = [screen for screen in app.screens() if screen is not removed_screen]
+        if not screens:
+            return
+        screen = app.primaryScreen() if app.primaryScreen() in screens else screens[0]
+        successor = next((canvas for canvas in self.canvases[1:] if canvas.target_screen is screen), None)
+        if successor is None:
+            self._add_screen(screen)
+            successor = self.canvases[-1]
+        self._make_primary(successor)
+
+    def _follow_primary_screen(self, screen):
+        """系統設定變更主螢幕時，工具列跟著移到新主螢幕的畫布。"""
+        for canvas in self.canvases[1:]:
+            if canvas.target_screen is screen:
+                self._make_primary(canvas)
+                return
+
+    def _make_primary(self, canvas: ScreenDrawWindow):
+        self.primary.hand_over_toolbar(canvas)
+        self.canvases.remove(canvas)
+        self.canvases.insert(0, canvas)
+        self.primary = canvas
+
+    def shutdown(self):
+        """程式結束前呼叫，釋放每個畫布的背景執行緒與暫存檔。"""
+        for canvas in self.canvases:
+            canvas.shutdown()
+
+    def isVisible(self) -> bool:
+        return any(canvas.isVisible() for canvas in self.canvases)
+
+    def toggle_drawing_mode(self, enable: bool):
+        self._drawing_mode = enable
+        # 主畫布最後顯示，進入畫記模式時由它取得鍵盤焦點
+        for canvas in reversed(self.canvases):
+            canvas.toggle_drawing_mode(enable)
+
+    def end_drawing_mode(self):
+        self.save_settings()
+        self.toggle_drawing_mode(False)
+        self.drawing_mode_ended.emit()
+
+    def _handle_canvas_ended(self):
+        """某個畫布自行結束畫記 (例如按下 Esc) 時，一併結束其他螢幕的畫布。"""
+        if self._drawing_mode:
+            self.toggle_drawing_mode(False)
+            self.drawing_mode_ended.emit()
+
+    def save_settings(self):
+        self.primary.save_settings()
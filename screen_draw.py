@@ -1,46 +1,38 @@
 import sys
 import math
-from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QVBoxLayout, QLineEdit,
+import os
+import contextlib
+import time
+import tempfile
+from array import array
+from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QVBoxLayout,
                              QPushButton, QColorDialog, QSlider, QHBoxLayout, QFileDialog, QComboBox, QMessageBox, QButtonGroup, QStyle, QCheckBox, QAction, QShortcut)
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal, QEvent, QRect, QSettings, QTimer, QSize, QByteArray
-import sys
-import math
-from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QVBoxLayout, QLineEdit,
-                             QPushButton, QColorDialog, QSlider, QHBoxLayout, QFileDialog, QComboBox, QMessageBox, QButtonGroup, QStyle, QCheckBox, QAction, QShortcut)
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal, QEvent, QRect, QSettings, QTimer, QSize, QByteArray
-from PyQt5.QtGui import QPainter, QPixmap, QPen, QColor, QCursor, QFont, QIcon, QPainterPath, QFontMetrics, QMouseEvent, QWheelEvent, QKeySequence
+from PyQt5.QtCore import Qt, QPoint, QLine, pyqtSignal, QEvent, QRect, QRectF, QSettings, QTimer, QSize, QByteArray
+from PyQt5.QtGui import QPainter, QPixmap, QImage, QImageReader, QRegion, QPen, QColor, QCursor, QFont, QIcon, QMouseEvent, QTabletEvent, QWheelEvent, QKeySequence
 
 from toolbar import MovableToolbar
-
-class MovableLineEdit(QLineEdit):
-    """一個可以透過滑鼠拖曳移動的 QLineEdit。"""
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self._is_dragging = False
-        self._offset = QPoint()
-
-    def mousePressEvent(self, event: QMouseEvent):
-        if event.button() == Qt.LeftButton:
-            self._is_dragging = True
-            self._offset = event.pos()
-        super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event: QMouseEvent):
-        if self._is_dragging:
-            new_pos = self.mapToParent(event.pos() - self._offset)
-            self.move(new_pos)
-        super().mouseMoveEvent(event)
-
-    def mouseReleaseEvent(self, event: QMouseEvent):
-        if event.button() == Qt.LeftButton:
-            self._is_dragging = False
-        super().mouseReleaseEvent(event)
+from canvas_history import CommandHistory, CompressedTile, device_rect
+from memory_budget import PixmapMemoryRegistry, MB
+from frame_scheduler import FrameScheduler, nearest_frame_rate
+from quality_governor import QualityGovernor, QUALITY_FULL
+from stroke_rasterizer import StrokeRasterizer
+from laser_trail import LaserTrail
+from preview_overlay import PreviewOverlay, PREVIEW_TOOLS
+from canvas_renderer import create_renderer, RENDERER_RASTER
+from input_shape import InkRegionTracker, rects_from_setting, PASS_THROUGH_OUTLINE_COLOR
+from text_editor import CanvasTextEditor
+from canvas_patterns import paint_pattern, pattern_from_label, label_from_pattern
+from draw_commands import DrawCommand, PenSamples, StrokeSession, EraserSession, HighlighterSession, draw_arrow, render_command
 
 class ScreenDrawWindow(QWidget):
     drawing_mode_ended = pyqtSignal()
     canvas_activated = pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, screen=None, toolbar: MovableToolbar = None, toolbar_actions: bool = True):
+        """
+        screen 為此畫布所在的螢幕 (預設為主螢幕)。多螢幕時其他螢幕的畫布傳入主畫布的 toolbar 共用，
+        toolbar_actions 為 False 時復原、清除、儲存等動作不直接連到此視窗，由 ScreenCanvasGroup 轉給使用中的畫布。
+        """
         super().__init__()
         self.setWindowTitle("螢幕畫記")
         self.setWindowFlags(
@@ -49,22 +41,24 @@ class ScreenDrawWindow(QWidget):
         )
         self.setFocusPolicy(Qt.StrongFocus)
 
-        screen_rect = QApplication.desktop().screenGeometry()
-        self.setGeometry(screen_rect)
+        self.target_screen = screen if screen is not None else QApplication.primaryScreen()
+        self.setGeometry(self.target_screen.geometry())
 
         self.settings = QSettings(QSettings.IniFormat, QSettings.UserScope, "MyClassroomTools", "ScreenDraw")
 
         # 獲取設備像素比例以適應高 DPI 螢幕
         # 確保 device_pixel_ratio 至少為 1.0，以避免除以零或在標準 DPI 下線條過細
-        self.device_pixel_ratio = self.devicePixelRatioF()
+        self.device_pixel_ratio = self.target_screen.devicePixelRatio()
         if self.device_pixel_ratio <= 0:
             self.device_pixel_ratio = 1.0
 
-        self.image = QPixmap(screen_rect.size())
-        self.image.fill(Qt.transparent)
+        self.image = None  # 筆跡圖層在第一次於此螢幕畫記時才配置 (見 _ensure_ink)
 
         self.background_pixmap = None
         self.loaded_background_image = None
+        self.static_layer = None  # 背景 + 格線的快取圖層
+        self._static_layer_state_key = None
+        self._static_layer_opaque = False
 
         self.drawing = False
         self.last_point = QPoint()
@@ -77,21 +71,88 @@ class ScreenDrawWindow(QWidget):
         self.start_point = None
         self.current_point = None
         self.cursor_pos = QPoint()
-        self.highlighter_temp_image = None
-
-        self.laser_trail_segments = []
+        self.highlighter_temp_image = None  # 目前螢光筆筆劃的暫存圖層 (HighlighterSession)，只涵蓋筆劃範圍
+        self.current_command = None
+        self.stroke_session = None  # 目前筆劃的畫筆與 QPainter，從按下沿用到放開
+        self.preview_overlay = PreviewOverlay()  # 拉線預覽，只重繪預覽線條經過的像素
+        self.preview_shift = False  # 由滑鼠/鍵盤事件記錄的 Shift 狀態
+
+        self.laser_trail = LaserTrail()
+        self.laser_trail_rect = QRect()  # 目前畫面上雷射筆軌跡的範圍
         self.laser_fade_timer = QTimer(self)
-        self.fade_step = 15
-
-        # History is now initialized once, here.
-        self.history_stack = [self.image.copy()]
-        self.redo_stack = []
-        self.history_limit = 20
+        self.laser_fade_timer.setInterval(16)
+
+        # 復原紀錄以向量指令保存每一步，並定期保存只含筆跡圖塊的點陣快照；
+        # 較舊的快照會在背景壓縮，只有超過記憶體預算時才捨棄最舊的步驟
+        self.history_budget_mb = self.settings.value("history_budget_mb", 64, type=int)
+        self.history_checkpoint_interval = 50
+        self.history = CommandHistory(self.history_budget_mb * MB, self.history_checkpoint_interval)
+
+        # 所有全螢幕緩衝區都登記到全域的記憶體登記表；超過上限時依序釋放
+        self.memory_ceiling_mb = self.settings.value("memory_ceiling_mb", 512, type=int)
+        self.memory_registry = PixmapMemoryRegistry.instance()
+        self.memory_registry.ceiling_bytes = self.memory_ceiling_mb * MB
+        self.memory_registry.register_provider(self, "history", self.history.total_bytes)
+        self.memory_registry.add_policy(self, "drop_redo", self._release_redo_stack)
+        self.memory_registry.add_policy(self, "compress_history", self.history.compress_all)
+
+        # 畫記模式隱藏一段時間後進入休眠：釋放桌面截圖並將筆跡壓縮保存
+        self.hibernate_delay_s = self.settings.value("hibernate_delay_s", 300, type=int)
+        self.hibernate_to_disk = self.settings.value("hibernate_to_disk", False, type=bool)
+        self.hibernated_ink = None       # CompressedTile；存到磁碟時其 data 為空
+        self.hibernated_ink_path = None
+        self.hibernate_timer = QTimer(self)
+        self.hibernate_timer.setSingleShot(True)
+        self.hibernate_timer.timeout.connect(self._hibernate)
+        # 休眠中直接結束程式時，暫存檔不會經過喚醒流程，需要在結束前刪除
+        QApplication.instance().aboutToQuit.connect(self.remove_hibernation_file)
+
+        # 滑鼠移動事件只排入佇列，依螢幕更新率每個畫面一次畫入並重繪 (0 代表跟隨螢幕更新率)
+        self.frame_rate_hz = self.settings.value("frame_rate_hz", 0, type=int)
+        self.frame_scheduler = FrameScheduler(self, self._flush_input_points, self._target_frame_rate())
+        # 選用：高頻輸入模式在畫記期間關閉 Qt 的移動事件合併，1000 Hz 的滑鼠或觸控筆每個取樣點都會保留；
+        # 移動事件只把座標放進佇列，每個畫面仍只處理一次整批座標
+        self.high_frequency_input = self.settings.value("high_frequency_input", False, type=bool)
+        self._saved_event_compression = None
+        # 觸控筆手繪筆劃尚未畫入的壓力、傾斜與時間 (與 FrameScheduler 佇列中的座標一一對應)
+        self._pending_pen_samples = None
+        self._pen_time_origin = 0
+
+        # 量測每個畫面的繪製時間，超出預算時暫時降低繪圖品質 (0 代表一個畫面的時間)
+        self.frame_budget_ms = self.settings.value("frame_budget_ms", 0, type=float)
+        self.quality_governor = QualityGovernor(self, self._target_frame_budget_ms())
+        self.quality_governor.level_changed.connect(self._handle_quality_change)
+        self._stroke_raster_ms = 0.0   # 上一次重繪之後，畫入筆跡所花的時間
+        self._stroke_degraded = False  # 目前筆劃是否曾以降低的品質繪製
+
+        # 選用：在背景執行緒畫入筆劃，GUI 執行緒只負責輸入與複製畫好的區域
+        self.threaded_rendering = self.settings.value("threaded_rendering", False, type=bool)
+        self.stroke_rasterizer = None
+        if self.threaded_rendering:
+            self.stroke_rasterizer = StrokeRasterizer(self)
+            self.stroke_rasterizer.rect_ready.connect(self.update)
+
+        # 選用：以 OpenGL 材質疊合背景、筆跡與預覽圖層；無法使用 OpenGL 時改回預設的點陣渲染器
+        self.renderer_name = self.settings.value("renderer", RENDERER_RASTER, type=str)
+        self.renderer = create_renderer(self, self.renderer_name)
+
+        # 選用：半透明畫布不再以近乎透明的顏色填滿整個螢幕，視窗外形只包含有筆跡的格子與擷取輸入的區域；
+        # pass_through_regions 內的滑鼠事件直接交給底下的程式 (例如播放中的影片)
+        self.shape_transparent_overlay = self.settings.value("shape_transparent_overlay", False, type=bool)
+        self.pass_through_regions = rects_from_setting(self.settings.value("pass_through_regions", []))
+        self.ink_region = InkRegionTracker()
+        self._ink_region_tracking = False
+        self._input_shape = QRegion()
 
         self.smoothing_enabled = True
-        self.point_buffer = []
 
-        self.text_input = None
+        # 文字直接在畫布上編輯：插入游標、選取範圍與虛線外框都畫在預覽圖層，不建立輸入元件
+        self.text_editor = CanvasTextEditor()
+        self.text_caret_timer = QTimer(self)
+        self.text_caret_timer.setInterval(max(1, QApplication.cursorFlashTime() // 2))
+        self.text_caret_timer.timeout.connect(self._blink_text_caret)
+        self._text_drag_pos = None  # 在編輯中的文字方塊內按下滑鼠的位置，拖曳時移動方塊
+        self._text_dragging = False
         self.font = QFont("Arial", 36)
 
         self.canvas_mode = 'desktop'
@@ -101,9 +162,14 @@ class ScreenDrawWindow(QWidget):
         self.setMouseTracking(True)
         self.setCursor(Qt.CrossCursor)
 
-        self.toolbar = MovableToolbar(self)
-        self._connect_toolbar_signals()
-        self.toolbar.hide()
+        self.owns_toolbar = toolbar is None
+        self.toolbar = MovableToolbar(self) if self.owns_toolbar else toolbar
+        # 共用工具列時，只有使用中的畫布可以更新工具列上的復原/重做按鈕 (由 ScreenCanvasGroup 切換)
+        self.toolbar_active = self.owns_toolbar
+        self._connect_toolbar_signals(toolbar_actions)
+        if self.owns_toolbar:
+            self.toolbar.hide()
+            self.toolbar.pass_through_button.setVisible(self.shape_transparent_overlay)
 
         self.laser_fade_timer.timeout.connect(self._fade_laser_trail)
         self._setup_shortcuts()
@@ -112,13 +178,106 @@ class ScreenDrawWindow(QWidget):
             self.setAttribute(Qt.WA_TranslucentBackground, True)
         else:
             self.setAttribute(Qt.WA_TranslucentBackground, False)
+        self._update_input_shape()
+        self._track_buffers()
+
+    def update(self, *args):
+        """重繪要求交給目前的渲染器 (參數與 QWidget.update 相同)。"""
+        self.renderer.update(*args)
+
+    def set_renderer(self, name: str):
+        """切換渲染器 ('raster' 或 'opengl')；回傳實際使用的渲染器名稱。"""
+        if name != self.renderer.name:
+            self.renderer.shutdown()
+            self.renderer = create_renderer(self, name)
+            self.update()
+        return self.renderer.name
+
+    def fall_back_to_raster_renderer(self):
+        """OpenGL 渲染器初始化失敗時呼叫，改由視窗自己的 paintEvent 繪製。"""
+        self.set_renderer(RENDERER_RASTER)
+
+    def _new_ink_image(self, size: QSize) -> QImage:
+        """
+        建立透明的筆跡圖層；以 premultiplied ARGB 的 QImage 保存，才能在背景執行緒中繪製。
+        圖層以裝置像素 (size × DPR) 配置並設定 devicePixelRatio：繪圖仍使用邏輯座標，
+        由 QPainter 一次換算成裝置像素，筆跡以螢幕的實際解析度繪製，重繪時 1:1 複製不需縮放。
+        """
+        image = QImage(size * self.device_pixel_ratio, QImage.Format_ARGB32_Premultiplied)
+        image.setDevicePixelRatio(self.device_pixel_ratio)
+        image.fill(Qt.transparent)
+        return image
+
+    def _ensure_ink(self) -> QImage:
+        """取得筆跡圖層，第一次畫記時才依畫布大小配置；從未畫記的螢幕不佔筆跡記憶體。"""
+        if self.image is None:
+            self.image = self._new_ink_image(self.size())
+            self.memory_registry.track(self, "image", self.image)
+        return self.image
+
+    def _sync_ink(self):
+        """等待背景執行緒畫完已排入的線段；在 GUI 執行緒讀寫筆跡圖層之前呼叫。"""
+        if self.stroke_rasterizer is not None:
+            self.stroke_rasterizer.sync()
+        if self.stroke_session is not None:
+            self.stroke_session.release_painter()
+
+    def _track_buffers(self):
+        """更新記憶體登記表中此視窗持有的各個影像緩衝區大小。"""
+        registry = self.memory_registry
+        registry.track(self, "image", self.image)
+        registry.track(self, "background_pixmap", self.background_pixmap)
+        registry.track(self, "loaded_background_image", self.loaded_background_image)
+        registry.track(self, "highlighter_temp_image", self.highlighter_temp_image)
+        registry.track(self, "static_layer", self.static_layer)
+
+    def _target_frame_rate(self) -> int:
+        if self.frame_rate_hz > 0:
+            return self.frame_rate_hz
+        return nearest_frame_rate(self.target_screen.refreshRate())
+
+    def _target_frame_budget_ms(self) -> float:
+        if self.frame_budget_ms > 0:
+            return self.frame_budget_ms
+        return 1000.0 / self.frame_scheduler.frame_rate
+
+    def _handle_quality_change(self, level: int):
+        if level == QUALITY_FULL and not self.drawing:
+            self.update() # 閒置時以完整品質重繪降級期間的畫面
+
+    def _release_redo_stack(self):
+        self.history.drop_redo()
+        self._update_undo_redo_buttons()
+
+    def _fit_background(self, pixmap: QPixmap) -> QPixmap:
+        """
+        將桌面截圖或讀入的圖片一次縮放成畫布的實際像素大小 (視窗大小 × DPR)，
+        之後的重繪與儲存都只是 1:1 複製，不會在每次重繪時重新取樣。
+        """
+        if pixmap is None or pixmap.isNull():
+            return pixmap
+        target = self.size() * self.device_pixel_ratio
+        if pixmap.size() != target:
+            pixmap = pixmap.scaled(target, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        pixmap.setDevicePixelRatio(self.device_pixel_ratio)
+        return pixmap
+
+    def _load_background_image(self, file_path: str) -> QPixmap:
+        """讀入背景圖片並直接解碼成畫布大小；大型相片不必先以原始解析度整張解碼。"""
+        reader = QImageReader(file_path)
+        if reader.size().isValid():
+            reader.setScaledSize(self.size() * self.device_pixel_ratio)
+        image = reader.read()
+        if image.isNull():
+            return QPixmap()
+        return self._fit_background(QPixmap.fromImage(image))
 
     def _grab_desktop_and_show(self):
         """A helper function to grab the desktop screenshot after a short delay."""
-        screen = QApplication.primaryScreen()
-        self.background_pixmap = screen.grabWindow(0)
+        self.background_pixmap = self._fit_background(self.target_screen.grabWindow(0))
         self.loaded_background_image = None
         self.canvas_mode = 'desktop'
+        self._track_buffers()
 
         # If the canvas was transparent, we need to make it opaque again for desktop mode.
         if self.testAttribute(Qt.WA_TranslucentBackground):
@@ -127,21 +286,25 @@ class ScreenDrawWindow(QWidget):
         self.showFullScreen()
         self.update()
 
-    def _connect_toolbar_signals(self):
+    def _connect_toolbar_signals(self, actions: bool = True):
+        # 工具與畫筆狀態：共用工具列的每個畫布都跟著改變
         self.toolbar.tool_changed.connect(self.handle_tool_change)
         self.toolbar.color_changed.connect(self.handle_color_change)
         self.toolbar.width_changed.connect(self.handle_width_change)
         self.toolbar.smoothing_toggled.connect(self.toggle_smoothing)
+        self.toolbar.pattern_changed.connect(self.handle_pattern_change)
+        self.toolbar.font_changed.connect(self.handle_font_change)
+        self.toolbar.font_size_changed.connect(self.handle_font_size_change)
+        self.toolbar.opacity_changed.connect(self.handle_opacity_change)
+        if not actions:
+            return
+        # 動作只作用在一個畫布上
         self.toolbar.undo_requested.connect(self.undo)
         self.toolbar.redo_requested.connect(self.redo)
         self.toolbar.clear_requested.connect(self.clear_screen)
         self.toolbar.save_requested.connect(self.handle_save_action)
         self.toolbar.exit_requested.connect(self.end_drawing_mode)
         self.toolbar.canvas_changed.connect(self.handle_canvas_change)
-        self.toolbar.pattern_changed.connect(self.handle_pattern_change)
-        self.toolbar.font_changed.connect(self.handle_font_change)
-        self.toolbar.font_size_changed.connect(self.handle_font_size_change)
-        self.toolbar.opacity_changed.connect(self.handle_opacity_change)
         self.toolbar.toolbar_activated.connect(self.canvas_activated.emit)
 
     def _setup_shortcuts(self):
@@ -151,23 +314,39 @@ class ScreenDrawWindow(QWidget):
         QShortcut(QKeySequence("4"), self).activated.connect(self.toolbar.text_button.click)
         QShortcut(QKeySequence("5"), self).activated.connect(self.toolbar.tool_button_group.button(5).click)
         QShortcut(QKeySequence("6"), self).activated.connect(self.toolbar.tool_button_group.button(6).click)
+        QShortcut(QKeySequence("7"), self).activated.connect(self.toolbar.pass_through_button.click)
         QShortcut(QKeySequence(Qt.Key_Left), self).activated.connect(self.toolbar.undo_button.click)
         QShortcut(QKeySequence(Qt.Key_Right), self).activated.connect(self.toolbar.redo_button.click)
         QShortcut(QKeySequence(Qt.Key_Delete), self).activated.connect(self.toolbar.clear_button.click)
 
+    def _laser_margin(self) -> int:
+        return int(math.ceil(self.pen_width / self.device_pixel_ratio / 2)) + 2
+
+    def _update_laser_trail_rect(self):
+        """重繪軌跡新舊範圍的聯集 (舊範圍用來擦掉已消失的線段)。"""
+        previous_rect = self.laser_trail_rect
+        self.laser_trail_rect = self.laser_trail.bounding_rect(self._laser_margin())
+        self.frame_scheduler.invalidate(previous_rect.united(self.laser_trail_rect))
+
     def _fade_laser_trail(self):
-        if not self.laser_trail_segments:
-            return
-        new_segments = []
-        for start_p, end_p, opacity in self.laser_trail_segments:
-            new_opacity = opacity - self.fade_step
-            if new_opacity > 0:
-                new_segments.append((start_p, end_p, new_opacity))
-        self.laser_trail_segments = new_segments
-        self.update()
+        """依經過時間淡出軌跡並只重繪軌跡範圍；軌跡完全消失後計時器自行停止。"""
+        self.laser_trail.prune(time.monotonic())
+        self._update_laser_trail_rect()
+        if not self.laser_trail:
+            self.laser_fade_timer.stop()
+
+    def _clear_laser_trail(self):
+        self.laser_trail.clear()
+        self._update_laser_trail_rect()
+        self.laser_fade_timer.stop()
 
     def handle_tool_change(self, tool_name: str):
+        if tool_name != 'text':
+            self._commit_text_input()
+        if self.current_tool == 'eraser' and tool_name != 'eraser':
+            self.update(self._eraser_preview_rect(self.cursor_pos)) # 移除舊的預覽圓圈
         self.current_tool = tool_name
+        self._update_eraser_preview()
         if self.current_tool == 'eraser':
             self.toolbar.set_width_value(self.eraser_width)
         else:
@@ -178,76 +357,148 @@ class ScreenDrawWindow(QWidget):
             self.setCursor(Qt.BlankCursor)
         else:
             self.setCursor(Qt.CrossCursor)
-        if self.current_tool != 'laser_pointer' and self.laser_fade_timer.isActive():
-            self.laser_trail_segments.clear()
-            self.laser_fade_timer.stop()
-            self.update()
-        elif self.current_tool == 'laser_pointer' and not self.laser_fade_timer.isActive():
-            self.laser_trail_segments.clear()
-            self.laser_fade_timer.start(30)
+        if self.current_tool != 'laser_pointer' and self.laser_trail:
+            self._clear_laser_trail()
 
     def handle_color_change(self, color: QColor):
         if color.isValid():
             self.pen_color = color
-            if self.text_input:
-                self.text_input.setStyleSheet(f"color: {color.name()}; background-color: transparent; border: 1px dashed {color.name()};")
+            self._update_text_editor_color()
 
     def handle_width_change(self, width: int):
         if self.current_tool == 'eraser':
+            previous_width = self.eraser_width
             self.eraser_width = width
+            self._update_eraser_preview(previous_width=previous_width)
         else:
             self.pen_width = width
 
     def handle_opacity_change(self, opacity: int):
         self.pen_opacity = opacity
+        self._update_text_editor_color()
 
     def toggle_smoothing(self, enabled: bool):
         self.smoothing_enabled = enabled
 
     def handle_font_change(self, font_family: str):
         self.font.setFamily(font_family)
-        self._update_text_input_font()
+        self._update_text_editor_font()
 
     def handle_font_size_change(self, size: int):
         self.font.setPointSize(size)
-        self._update_text_input_font()
-
-    def _update_text_input_font(self):
-        if self.text_input:
-            self.text_input.setFont(self.font)
-            metrics = QFontMetrics(self.font)
-            text_width = metrics.horizontalAdvance(self.text_input.text()) + 20
-            text_height = metrics.height() + 10
-            self.text_input.setFixedSize(max(100, text_width), text_height)
-
-    def _save_history(self):
-        self.redo_stack.clear()
-        if len(self.history_stack) >= self.history_limit:
-            del self.history_stack[0]
-        self.history_stack.append(self.image.copy())
+        self._update_text_editor_font()
+
+    def _update_text_editor_font(self):
+        if self.text_editor.is_active():
+            self.update(self.text_editor.set_font(self.font))
+
+    def _update_text_editor_color(self):
+        if self.text_editor.is_active():
+            self.update(self.text_editor.set_color(self._get_current_pen_color()))
+
+    def _blink_text_caret(self):
+        if self.text_editor.is_active():
+            self.frame_scheduler.invalidate(self.text_editor.blink())
+        else:
+            self.text_caret_timer.stop()
+
+    def _touch_history(self, rect: QRect):
+        """在畫入 self.image 之前呼叫，讓復原紀錄累積這一步的影響範圍。"""
+        self.history.touch(rect)
+
+    def _save_history(self, command: DrawCommand):
+        self.history.commit(self.image, command)
+        if self._ink_region_tracking:
+            if command.tool == 'clear':
+                self.ink_region.reset()
+                changed = True
+            elif command.tool == 'eraser':
+                changed = self.ink_region.rescan(self.image, command.bounding_rect())
+            else:
+                changed = self.ink_region.add(self.image, command.bounding_rect())
+            if changed:
+                self._update_input_shape()
         self._update_undo_redo_buttons()
+        self.memory_registry.enforce()
+
+    def _input_shaping_active(self) -> bool:
+        return self.shape_transparent_overlay and self.canvas_mode == 'transparent'
+
+    def _capture_region(self) -> QRegion:
+        """擷取滑鼠輸入的區域：整個畫布扣除設定為穿透的區域。"""
+        region = QRegion(self.rect())
+        for rect in self.pass_through_regions:
+            region = region.subtracted(QRegion(rect))
+        return region
+
+    def _update_input_shape(self):
+        """依目前的筆跡與穿透區域更新視窗外形；外形以外的像素不需要合成，滑鼠事件也會穿透。"""
+        if not self._input_shaping_active():
+            self._ink_region_tracking = False
+            if not self._input_shape.isEmpty():
+                self._input_shape = QRegion()
+                self.clearMask()
+            return
+        if not self._ink_region_tracking:
+            # 剛切換到此模式：掃描一次整張筆跡圖層，之後只依每一步的影響範圍更新
+            self.ink_region.reset(self.image)
+            self._ink_region_tracking = True
+        if self.drawing or self.text_editor.is_active():
+            # 繪製中的筆劃、預覽或文字方塊可能經過穿透區域，結束前暫時以整個視窗為外形才看得到
+            shape = QRegion(self.rect())
+        else:
+            shape = self._capture_region()
+            if self.image is not None:
+                shape = shape.united(self.ink_region.region(self.rect()))
+        if shape.isEmpty():
+            # 空的 mask 代表取消外形，保留一個像素讓整個畫面都能穿透
+            shape = QRegion(0, 0, 1, 1)
+        if shape != self._input_shape:
+            self._input_shape = shape
+            self.setMask(shape)
+
+    def set_pass_through_regions(self, rects: list):
+        """設定滑鼠事件直接穿透到底下程式的區域 (邏輯座標的 QRect 清單)。"""
+        self.pass_through_regions = [QRect(rect) for rect in rects if not rect.isEmpty()]
+        self._update_input_shape()
+        self.update()
 
     def _update_undo_redo_buttons(self):
-        self.toolbar.set_undo_enabled(len(self.history_stack) > 1)
-        self.toolbar.set_redo_enabled(bool(self.redo_stack))
+        if not self.toolbar_active:
+            return
+        self.toolbar.set_undo_enabled(self.history.can_undo())
+        self.toolbar.set_redo_enabled(self.history.can_redo())
 
     def undo(self):
-        if len(self.history_stack) > 1:
-            self.redo_stack.append(self.history_stack.pop())
-            self.image = self.history_stack[-1].copy()
-            self.update()
+        if not self.history.can_undo():
+            return
+        self._sync_ink()
+        dirty_rect = self.history.undo(self._ensure_ink())
+        if dirty_rect is not None:
+            self._rescan_ink_region(dirty_rect)
+            self.update(dirty_rect)
             self._update_undo_redo_buttons()
 
     def redo(self):
-        if self.redo_stack:
-            self.history_stack.append(self.redo_stack.pop())
-            self.image = self.history_stack[-1].copy()
-            self.update()
+        if not self.history.can_redo():
+            return
+        self._sync_ink()
+        dirty_rect = self.history.redo(self._ensure_ink())
+        if dirty_rect is not None:
+            self._rescan_ink_region(dirty_rect)
+            self.update(dirty_rect)
             self._update_undo_redo_buttons()
 
+    def _rescan_ink_region(self, rect: QRect):
+        if self._ink_region_tracking and self.ink_region.rescan(self.image, rect):
+            self._update_input_shape()
+
     def clear_screen(self):
+        if self.image is None:
+            return # 此螢幕尚未畫記，沒有需要清除的筆跡
+        self._sync_ink()
         self.image.fill(Qt.transparent)
-        self._save_history()
+        self._save_history(DrawCommand('clear'))
         self.update()
 
     def handle_canvas_change(self, canvas_type: str):
@@ -289,7 +540,7 @@ class ScreenDrawWindow(QWidget):
         elif canvas_type == "讀取檔案":
             file_path, _ = QFileDialog.getOpenFileName(self, "選擇背景圖片", "", "Image Files (*.png *.jpg *.bmp *.jpeg)")
             if file_path:
-                self.loaded_background_image = QPixmap(file_path)
+                self.loaded_background_image = self._load_background_image(file_path)
                 if not self.loaded_background_image.isNull():
                     new_mode = 'file'
                     self.background_pixmap = None
@@ -306,12 +557,14 @@ class ScreenDrawWindow(QWidget):
             return
 
         self.canvas_mode = new_mode
+        self._track_buffers()
         
         is_new_mode_transparent = (self.canvas_mode == 'transparent')
         if is_currently_transparent != is_new_mode_transparent:
             self.setAttribute(Qt.WA_TranslucentBackground, is_new_mode_transparent)
             self.hide()
             self.showFullScreen()
+        self._update_input_shape()
         
         self.update()
 
@@ -322,8 +575,7 @@ class ScreenDrawWindow(QWidget):
         }.get(mode, '桌面')
 
     def handle_pattern_change(self, pattern_type: str):
-        mode_map = {"無": 'none', "細方格": 'fine_grid', "粗方格": 'coarse_grid'}
-        self.pattern_mode = mode_map.get(pattern_type, 'none')
+        self.pattern_mode = pattern_from_label(pattern_type)
         self.update()
 
     def handle_save_action(self):
@@ -339,22 +591,22 @@ class ScreenDrawWindow(QWidget):
         elif msg_box.clickedButton() == save_crop_button:
             self.handle_tool_change('crop')
 
-    def save_drawing(self):
-        combined_pixmap = QPixmap(self.size())
+    def _compose_export(self) -> QPixmap:
+        """以裝置像素合成背景、格線與筆跡，匯出的圖片與螢幕上的像素完全相同。"""
+        combined_pixmap = QPixmap(self.size() * self.device_pixel_ratio)
+        combined_pixmap.setDevicePixelRatio(self.device_pixel_ratio)
         combined_pixmap.fill(Qt.transparent)
         painter = QPainter(combined_pixmap)
-        if self.canvas_mode == 'desktop' and self.background_pixmap:
-            painter.drawPixmap(self.rect(), self.background_pixmap)
-        elif self.canvas_mode in ['blackboard', 'whiteboard', 'solid']:
-            painter.fillRect(self.rect(), self.canvas_color)
-        elif self.canvas_mode == 'file' and self.loaded_background_image:
-            painter.drawPixmap(self.rect(), self.loaded_background_image)
-        elif self.canvas_mode == 'transparent':
-            pass
-
+        self._paint_background(painter, for_display=False)
         self.draw_pattern(painter)
-        painter.drawPixmap(self.rect(), self.image)
+        if self.image is not None:
+            self._sync_ink()
+            painter.drawImage(QPoint(0, 0), self.image)
         painter.end()
+        return combined_pixmap
+
+    def save_drawing(self):
+        combined_pixmap = self._compose_export()
 
         file_path, _ = QFileDialog.getSaveFileName(self, "儲存畫記", "", "PNG 圖片 (*.png);;JPEG 圖片 (*.jpg *.jpeg)")
         if file_path:
@@ -367,31 +619,13 @@ class ScreenDrawWindow(QWidget):
         self.toggle_drawing_mode(False)
         self.drawing_mode_ended.emit()
 
-    def draw_pattern(self, painter: QPainter):
-        if self.pattern_mode == 'none': return
-        grid_size = 25 if self.pattern_mode == 'fine_grid' else 75
-        pen = QPen(QColor(128, 128, 128, 100), 1, Qt.SolidLine)
-        painter.setPen(pen)
-        for x in range(0, self.width(), grid_size):
-            painter.drawLine(x, 0, x, self.height())
-        for y in range(0, self.height(), grid_size):
-            painter.drawLine(0, y, self.width(), y)
+    def draw_pattern(self, painter: QPainter, rect: QRect = None):
+        """以快取的格線材質填滿 rect (預設為整個畫布)。"""
+        paint_pattern(painter, rect if rect is not None else self.rect(), self.pattern_mode, self.rect())
 
     def save_cropped_area(self, crop_rect: QRect):
-        combined_pixmap = QPixmap(self.size())
-        painter = QPainter(combined_pixmap)
-        if self.canvas_mode == 'desktop' and self.background_pixmap:
-            painter.drawPixmap(self.rect(), self.background_pixmap)
-        elif self.canvas_mode in ['blackboard', 'whiteboard', 'solid']:
-            painter.fillRect(self.rect(), self.canvas_color)
-        elif self.canvas_mode == 'file' and self.loaded_background_image:
-            painter.drawPixmap(self.rect(), self.loaded_background_image)
-
-        self.draw_pattern(painter)
-        painter.drawPixmap(self.rect(), self.image)
-        painter.end()
-
-        cropped_pixmap = combined_pixmap.copy(crop_rect)
+        combined_pixmap = self._compose_export()
+        cropped_pixmap = combined_pixmap.copy(device_rect(crop_rect, self.device_pixel_ratio))
         file_path, _ = QFileDialog.getSaveFileName(self, "儲存選取範圍", "", "PNG 圖片 (*.png);;JPEG 圖片 (*.jpg *.jpeg)")
         if file_path:
             cropped_pixmap.save(file_path)
@@ -399,35 +633,168 @@ class ScreenDrawWindow(QWidget):
     def toggle_drawing_mode(self, enable: bool):
         """Toggles the drawing mode on or off."""
         if enable:
+            self.hibernate_timer.stop()
+            self._wake_from_hibernation()
             # Refresh the background screenshot only when entering desktop mode.
             if self.canvas_mode == 'desktop':
-                screen = QApplication.primaryScreen()
-                self.background_pixmap = screen.grabWindow(0)
+                self.background_pixmap = self._fit_background(self.target_screen.grabWindow(0))
+                self.memory_registry.track(self, "background_pixmap", self.background_pixmap)
             
+            self.frame_scheduler.set_frame_rate(self._target_frame_rate())
+            self._set_event_compression(False)
+            self.quality_governor.budget_ms = self._target_frame_budget_ms()
             # Drawings and history are now preserved across hide/show.
             self._update_undo_redo_buttons() # Ensure buttons are in correct state.
-            self.toolbar.show()
+            if self.owns_toolbar:
+                self.toolbar.show()
             self.showFullScreen()
             self.raise_()
             self.activateWindow()
             self.setFocus()
         else:
-            self.toolbar.hide()
+            self._commit_text_input()
+            self._set_event_compression(True)
+            if self.owns_toolbar:
+                self.toolbar.hide()
             self.hide()
+            if self.hibernate_delay_s > 0:
+                self.hibernate_timer.start(self.hibernate_delay_s * 1000)
+
+    def _set_event_compression(self, enabled: bool):
+        """
+        高頻輸入模式：畫記期間關閉 Qt 對滑鼠移動與觸控筆事件的合併，結束時還原原本的設定。
+        這是整個應用程式的屬性，多螢幕時只由主畫布切換。
+        """
+        if not self.high_frequency_input or not self.owns_toolbar:
+            return
+        if not enabled and self._saved_event_compression is None:
+            self._saved_event_compression = (QApplication.testAttribute(Qt.AA_CompressHighFrequencyEvents),
+                                             QApplication.testAttribute(Qt.AA_CompressTabletEvents))
+            QApplication.setAttribute(Qt.AA_CompressHighFrequencyEvents, False)
+            QApplication.setAttribute(Qt.AA_CompressTabletEvents, False)
+        elif enabled and self._saved_event_compression is not None:
+            compress_mouse, compress_tablet = self._saved_event_compression
+            QApplication.setAttribute(Qt.AA_CompressHighFrequencyEvents, compress_mouse)
+            QApplication.setAttribute(Qt.AA_CompressTabletEvents, compress_tablet)
+            self._saved_event_compression = None
+
+    def is_hibernated(self) -> bool:
+        return self.hibernated_ink is not None
+
+    def _hibernate(self):
+        """釋放隱藏期間用不到的全螢幕緩衝區，筆跡則壓縮保存在記憶體或暫存檔中。"""
+        if self.isVisible() or self.is_hibernated():
+            return
+        # 桌面截圖在重新進入畫記模式時會重新擷取，不需要保留；靜態圖層也會在需要時重建
+        self.background_pixmap = None
+        self.static_layer = None
+        if self.image is None:
+            self._track_buffers()
+            return # 此螢幕從未畫記，沒有筆跡需要保存
+        self._sync_ink()
+        self.hibernated_ink = CompressedTile(self.image)
+        if self.hibernate_to_disk:
+            try:
+                with tempfile.NamedTemporaryFile(prefix="screen_draw_", suffix=".ink", delete=False) as ink_file:
+                    ink_file.write(self.hibernated_ink.data)
+                self.hibernated_ink_path = ink_file.name
+                self.hibernated_ink.data = b""
+            except OSError:
+                self.hibernated_ink_path = None  # 寫入失敗時保留在記憶體中
+        self.image = None
+        self.history.compress_all()
+        self._track_buffers()
+
+    def shutdown(self):
+        """
+        移除畫布 (例如拔除投影機) 或結束程式前呼叫：停止計時器與背景執行緒、刪除休眠暫存檔，
+        並從記憶體登記表移除，畫布物件才能被回收。
+        """
+        self.hibernate_timer.stop()
+        self.laser_fade_timer.stop()
+        self.text_caret_timer.stop()
+        self.remove_hibernation_file()
+        if self.stroke_rasterizer is not None:
+            self.stroke_rasterizer.stop()
+            self.stroke_rasterizer = None
+        self.history.shutdown()
+        self.renderer.shutdown()
+        self.memory_registry.release(self)
+
+    def hand_over_toolbar(self, successor: 'ScreenDrawWindow'):
+        """主螢幕改變時把工具列交給 successor，之後由它負責顯示工具列與切換高頻輸入設定。"""
+        self._set_event_compression(True)  # 先以原本的擁有者還原應用程式層級的設定
+        visible = self.toolbar.isVisible()
+        self.toolbar.setParent(successor, self.toolbar.windowFlags())
+        self.owns_toolbar = False
+        successor.owns_toolbar = True
+        if not successor.geometry().intersects(self.toolbar.frameGeometry()):
+            self.toolbar.move(successor.geometry().topLeft() + QPoint(20, 20))
+        if visible:
+            self.toolbar.show()
+        if successor.isVisible():
+            successor._set_event_compression(False)
+
+    def remove_hibernation_file(self):
+        """刪除休眠時寫入的筆跡暫存檔；喚醒、移除畫布或程式結束時呼叫。"""
+        if self.hibernated_ink_path:
+            try:
+                os.remove(self.hibernated_ink_path)
+            except OSError:
+                pass
+            self.hibernated_ink_path = None
+
+    def _wake_from_hibernation(self):
+        if not self.is_hibernated():
+            return
+        if self.hibernated_ink_path:
+            try:
+                with open(self.hibernated_ink_path, "rb") as ink_file:
+                    self.hibernated_ink.data = ink_file.read()
+            except OSError:
+                self.hibernated_ink.data = b""
+            self.remove_hibernation_file()
+        if self.hibernated_ink.data:
+            self.image = self.hibernated_ink.to_image()
+        else:
+            # 暫存檔遺失時只能從空白畫布開始，同時清掉已無法對應的復原紀錄
+            self.image = self._new_ink_image(self.size())
+            self.history.clear()
+        self.hibernated_ink = None
+        self._ink_region_tracking = False  # 重新掃描還原的筆跡
+        self._update_input_shape()
+        self._track_buffers()
 
     def save_settings(self):
+        if not self.owns_toolbar:
+            return # 共用工具列的畫布由主畫布寫入設定
         self.toolbar.save_state_to_settings(self.settings)
         self.settings.setValue("pen_width", self.pen_width)
         self.settings.setValue("eraser_width", self.eraser_width)
         self.settings.setValue("canvas_mode", self.canvas_mode)
         self.settings.setValue("canvas_color", self.canvas_color)
         self.settings.setValue("pattern_mode", self.pattern_mode)
+        self.settings.setValue("history_budget_mb", self.history_budget_mb)
+        self.settings.setValue("memory_ceiling_mb", self.memory_ceiling_mb)
+        self.settings.setValue("hibernate_delay_s", self.hibernate_delay_s)
+        self.settings.setValue("hibernate_to_disk", self.hibernate_to_disk)
+        self.settings.setValue("frame_rate_hz", self.frame_rate_hz)
+        self.settings.setValue("frame_budget_ms", self.frame_budget_ms)
+        self.settings.setValue("high_frequency_input", self.high_frequency_input)
+        self.settings.setValue("threaded_rendering", self.threaded_rendering)
+        self.settings.setValue("renderer", self.renderer_name)
+        self.settings.setValue("shape_transparent_overlay", self.shape_transparent_overlay)
+        self.settings.setValue("pass_through_regions", self.pass_through_regions)
         self.settings.sync()
 
     def load_settings(self):
         self.pen_width = self.settings.value("pen_width", 5, type=int)
         self.eraser_width = self.settings.value("eraser_width", 20, type=int)
-        self.toolbar.set_initial_state(self.settings, self.font.family(), self.font.pointSize())
+        if self.owns_toolbar:
+            self.toolbar.set_initial_state(self.settings, self.font.family(), self.font.pointSize())
+        else:
+            self.handle_tool_change(self.toolbar.current_tool_name)
+            self.pen_opacity = self.toolbar.opacity_slider.value()
         self.pen_color = self.toolbar.pen_color
         self.smoothing_enabled = self.toolbar.smooth_button.isChecked()
         self.font.setFamily(self.toolbar.font_family)
@@ -436,12 +803,13 @@ class ScreenDrawWindow(QWidget):
         canvas_color = self.settings.value("canvas_color", QColor("#2E4636"))
         self.canvas_color = canvas_color if isinstance(canvas_color, QColor) else QColor("#2E4636")
         self.pattern_mode = self.settings.value("pattern_mode", "none", type=str)
+        if not self.owns_toolbar:
+            return
         self.toolbar.canvas_combo.blockSignals(True)
         self.toolbar.canvas_combo.setCurrentText(self.get_mode_text(self.canvas_mode))
         self.toolbar.canvas_combo.blockSignals(False)
         self.toolbar.pattern_combo.blockSignals(True)
-        pattern_map_rev = {'none': "無", 'fine_grid': "細方格", 'coarse_grid': "粗方格"}
-        self.toolbar.pattern_combo.setCurrentText(pattern_map_rev.get(self.pattern_mode, "無"))
+        self.toolbar.pattern_combo.setCurrentText(label_from_pattern(self.pattern_mode))
         self.toolbar.pattern_combo.blockSignals(False)
 
     def _get_current_pen_color(self) -> QColor:
@@ -450,16 +818,11 @@ class ScreenDrawWindow(QWidget):
         color.setAlpha(self.pen_opacity)
         return color
 
+    def _get_arrow_size(self) -> float:
+        return (self.pen_width * 3 + 10) / self.device_pixel_ratio # 調整箭頭大小以適應 DPI
+
     def draw_arrow(self, painter: QPainter, start_point: QPoint, end_point: QPoint):
-        line = end_point - start_point
-        if line.isNull(): return
-        angle = math.atan2(-line.y(), line.x())
-        arrow_size = (self.pen_width * 3 + 10) / self.device_pixel_ratio # 調整箭頭大小以適應 DPI
-        painter.drawLine(start_point, end_point)
-        arrow_p1 = end_point - QPoint(int(math.cos(angle + math.pi / 6) * arrow_size), int(-math.sin(angle + math.pi / 6) * arrow_size))
-        arrow_p2 = end_point - QPoint(int(math.cos(angle - math.pi / 6) * arrow_size), int(-math.sin(angle - math.pi / 6) * arrow_size))
-        painter.drawLine(end_point, arrow_p1)
-        painter.drawLine(end_point, arrow_p2)
+        draw_arrow(painter, start_point, end_point, self._get_arrow_size())
 
     def _get_constrained_point(self, start_point: QPoint, current_point: QPoint) -> QPoint:
         dx = current_point.x() - start_point.x()
@@ -469,319 +832,420 @@ class ScreenDrawWindow(QWidget):
         constrained_y = start_point.y() + (side if dy > 0 else -side)
         return QPoint(constrained_x, constrained_y)
 
+    def _shape_bounding_rect(self, start_point: QPoint, end_point: QPoint, shift: bool) -> QRect:
+        """回傳直線、箭頭、矩形或圓形最終繪製時會影響的範圍（含筆寬）。"""
+        if self.current_tool == 'circle':
+            if shift:
+                rx = ry = math.hypot(end_point.x() - start_point.x(), end_point.y() - start_point.y())
+            else:
+                rx = abs(end_point.x() - start_point.x())
+                ry = abs(end_point.y() - start_point.y())
+            rect = QRect(int(start_point.x() - rx), int(start_point.y() - ry), int(2 * rx), int(2 * ry))
+        else:
+            rect = QRect(start_point, end_point).normalized()
+        margin = self.pen_width + 2
+        if self.current_tool == 'arrow':
+            margin += self.pen_width * 3 + 10
+        return rect.adjusted(-margin, -margin, margin, margin)
+
+    def _create_shape_command(self, start_point: QPoint, end_point: QPoint, shift: bool) -> DrawCommand:
+        command = DrawCommand(self.current_tool, self._get_current_pen_color(), self.pen_width / self.device_pixel_ratio)
+        command.add_point(start_point)
+        command.add_point(end_point)
+        if self.current_tool == 'arrow':
+            command.extra = self._get_arrow_size()
+        elif self.current_tool == 'circle':
+            center_x, center_y = start_point.x(), start_point.y()
+            end_x, end_y = end_point.x(), end_point.y()
+            if shift:
+                # Perfect circle (radius is distance from center to end point)
+                radius = math.hypot(end_x - center_x, end_y - center_y)
+                command.extra = (radius, radius)
+            else:
+                # Ellipse (rx, ry are distances from center to end point)
+                command.extra = (abs(end_x - center_x), abs(end_y - center_y))
+        return command
+
+    def _begin_stroke(self, pos: QPoint, samples: PenSamples = None):
+        """在按下滑鼠時建立手繪、螢光筆或橡皮擦的筆劃指令；觸控筆的手繪筆劃另外傳入第一個點的 samples。"""
+        if self.current_tool == 'highlighter':
+            highlighter_color = QColor(self.pen_color.red(), self.pen_color.green(), self.pen_color.blue(), 64)
+            self.current_command = DrawCommand('highlighter', highlighter_color, (self.pen_width * 2) / self.device_pixel_ratio)
+        elif self.current_tool == 'eraser':
+            self.current_command = DrawCommand('eraser', None, self.eraser_width / self.device_pixel_ratio,
+                                               antialias=self.smoothing_enabled)
+        else:
+            self.current_command = DrawCommand('freehand', self._get_current_pen_color(), self.pen_width / self.device_pixel_ratio,
+                                               antialias=self.smoothing_enabled, smooth=self.smoothing_enabled,
+                                               extra=PenSamples() if samples is not None else None)
+        # 背景執行緒繪製時每批各自開關 QPainter，GUI 執行緒才能隨時安全地讀寫圖層
+        session_class = {'highlighter': HighlighterSession, 'eraser': EraserSession}.get(self.current_tool, StrokeSession)
+        self.stroke_session = session_class(self._ensure_ink(), self.current_command, keep_painter=self.stroke_rasterizer is None)
+        self._pending_pen_samples = PenSamples() if isinstance(self.current_command.extra, PenSamples) else None
+        self.update(self._extend_stroke(array('i', (pos.x(), pos.y())), samples))
+
+    def _extend_stroke(self, points, samples: PenSamples = None) -> QRect:
+        """將一串新的座標 (x0, y0, x1, y1, ...) 加入目前筆劃，只畫出新增的線段，回傳畫入的範圍。"""
+        start = time.perf_counter()
+        session = self.stroke_session
+        antialias = None
+        if session.command.antialias and not self.quality_governor.antialias_strokes():
+            antialias = False # 降級：繪製中不反鋸齒，提交時再以完整品質重畫
+            self._stroke_degraded = True
+        self.last_point = QPoint(points[-2], points[-1])
+        if self.stroke_rasterizer is not None:
+            # 由背景執行緒畫入，完成後透過 rect_ready 要求重繪
+            self.stroke_rasterizer.submit(session, points, antialias, samples)
+            return QRect()
+        update_rect = session.add_points(points, antialias, samples)
+        self._touch_history(update_rect)
+        if isinstance(session, HighlighterSession) and session.image is not self.highlighter_temp_image:
+            # 暫存圖層隨筆劃範圍擴大而重新配置
+            self.highlighter_temp_image = session.image
+            self.memory_registry.track(self, "highlighter_temp_image", session.image)
+        self._stroke_raster_ms += (time.perf_counter() - start) * 1000.0
+        return update_rect
+
+    def _flush_input_points(self, points) -> QRect:
+        """FrameScheduler 每個畫面呼叫一次，由目前的工具一次處理這段期間累積的所有座標。"""
+        if self.current_tool == 'laser_pointer':
+            return self._extend_laser_trail(points) if self.drawing else QRect()
+        if self.current_command is None or self.image is None:
+            return QRect()
+        previous_point = self.last_point
+        samples = self._pending_pen_samples
+        if samples is not None:
+            self._pending_pen_samples = PenSamples()
+        update_rect = self._extend_stroke(points, samples)
+        if self.current_tool == 'eraser':
+            # 預覽圓圈從上一個畫面的位置移到目前的位置
+            update_rect = update_rect.united(self._eraser_preview_rect(previous_point)).united(
+                self._eraser_preview_rect(self.cursor_pos))
+        return update_rect
+
+    def _extend_laser_trail(self, points) -> QRect:
+        """將一串座標接在雷射筆軌跡之後 (同一個畫面的線段共用時間)，回傳需要重繪的範圍。"""
+        self.laser_trail.add_run(self.last_point.x(), self.last_point.y(), points, time.monotonic())
+        self.last_point = QPoint(points[-2], points[-1])
+        if not self.laser_fade_timer.isActive():
+            self.laser_fade_timer.start()
+        # 新線段會改變頭尾漸細的位置，因此重繪整條軌跡的範圍 (而非整個視窗)
+        previous_rect = self.laser_trail_rect
+        self.laser_trail_rect = self.laser_trail.bounding_rect(self._laser_margin())
+        return previous_rect.united(self.laser_trail_rect)
+
+    def _finish_stroke(self):
+        command, session = self.current_command, self.stroke_session
+        self.current_command = None
+        self.stroke_session = None
+        self._pending_pen_samples = None
+        if self.stroke_rasterizer is not None:
+            self.stroke_rasterizer.sync()
+            self._touch_history(self.stroke_rasterizer.take_dirty_rect())
+        self._touch_history(session.finish())
+        if isinstance(session, HighlighterSession):
+            self.highlighter_temp_image = None
+            self.memory_registry.track(self, "highlighter_temp_image", None)
+        if self._stroke_degraded:
+            self.history.redraw_pending(self.image, command)
+            self._stroke_degraded = False
+        self._save_history(command)
+        self.quality_governor.restore()
+        return command.bounding_rect()
+
+    def _begin_text_input(self, pos: QPoint):
+        self.update(self.text_editor.begin(pos, self.font, self._get_current_pen_color()))
+        self.setAttribute(Qt.WA_InputMethodEnabled, True)
+        QApplication.inputMethod().update(Qt.ImQueryAll)
+        self.text_caret_timer.start()
+
     def _commit_text_input(self):
-        if self.text_input and self.text_input.text():
-            painter = QPainter(self.image)
-            painter.setPen(self._get_current_pen_color())
-            painter.setFont(self.font)
-            text_rect = self.text_input.geometry()
-            draw_rect = text_rect.adjusted(3, 0, -5, 0)
-            painter.drawText(draw_rect, Qt.AlignVCenter | Qt.AlignLeft, self.text_input.text())
+        """結束文字方塊的編輯；有輸入文字時以文字指令畫入筆跡圖層並寫入復原紀錄。"""
+        if not self.text_editor.is_active():
+            return
+        color = self.text_editor.color
+        font_description = self.text_editor.font.toString()
+        box_rect = self.text_editor.rect()
+        text, text_rect, dirty_region = self.text_editor.finish()
+        self.text_caret_timer.stop()
+        self._text_drag_pos = None
+        self.setAttribute(Qt.WA_InputMethodEnabled, False)
+        if text.strip():
+            extra = (text, font_description, (text_rect.x(), text_rect.y(), text_rect.width(), text_rect.height()))
+            command = DrawCommand('text', color, antialias=False, extra=extra)
+            self._touch_history(box_rect)
+            painter = QPainter(self._ensure_ink())
+            render_command(painter, command)
             painter.end()
-            self._save_history()
-        if self.text_input:
-            self.text_input.deleteLater()
-            self.text_input = None
-        self.update()
+            self._save_history(command)
+        self.update(dirty_region)
+        self._update_input_shape()
 
     def mousePressEvent(self, event: QMouseEvent):
-        self._commit_text_input()
         self.canvas_activated.emit()
+        if event.button() == Qt.LeftButton and self.text_editor.contains(event.pos()):
+            # 點在編輯中的文字方塊內：移動插入游標 (Shift 延伸選取)，拖曳則移動整個方塊
+            self.update(self.text_editor.set_cursor_at(event.pos(), bool(event.modifiers() & Qt.ShiftModifier)))
+            self._text_drag_pos = event.pos()
+            self._text_dragging = False
+            return
+        self._commit_text_input()
         if event.button() == Qt.LeftButton:
             self.drawing = True
             self.last_point = event.pos()
             if self.current_tool == 'text':
-                self.text_input = MovableLineEdit(self)
-                self.text_input.setFont(self.font)
-                self.text_input.setStyleSheet(f"color: {self.pen_color.name()}; background-color: transparent; border: 1px dashed {self.pen_color.name()};")
-                self.text_input.move(event.pos())
-                self.text_input.setFixedSize(100, QFontMetrics(self.font).height() + 10)
-                self.text_input.show()
-                self.text_input.setFocus()
-                self.text_input.textChanged.connect(self._update_text_input_font)
+                self._begin_text_input(event.pos())
             elif self.current_tool == 'laser_pointer':
-                self.laser_trail_segments.clear()
-            elif self.current_tool in ['line', 'arrow', 'rectangle', 'circle', 'crop']:
+                self._clear_laser_trail()
+            elif self.current_tool in PREVIEW_TOOLS:
                 self.start_point = event.pos()
                 self.current_point = event.pos()
-            elif self.current_tool == 'highlighter':
+                self.preview_shift = bool(event.modifiers() & Qt.ShiftModifier)
+            elif self.current_tool in ['freehand', 'highlighter', 'eraser']:
                 # Draw directly on self.image for correct opacity blending
-                painter = QPainter(self.image)
-                painter.setRenderHint(QPainter.Antialiasing)
-                highlighter_color = QColor(self.pen_color.red(), self.pen_color.green(), self.pen_color.blue(), 64)
-                pen = QPen(highlighter_color, self.pen_width * 2, Qt.SolidLine, Qt.SquareCap, Qt.RoundJoin)
-                painter.setPen(pen)
-                painter.drawPoint(self.last_point)
-                painter.end()
-                width = self.pen_width * 2 + 2
-                update_rect = QRect(self.last_point, self.last_point).adjusted(-width, -width, width, width)
-                self.update(update_rect)
-            elif self.current_tool in ['freehand', 'eraser']:
-                if self.current_tool == 'freehand' and self.smoothing_enabled:
-                    self.point_buffer = [event.pos()]
-                else:
-                    painter = QPainter(self.image)
-                    painter.setRenderHint(QPainter.Antialiasing)
-                    width = 0
-                    if self.current_tool == 'eraser':
-                        painter.setCompositionMode(QPainter.CompositionMode_Clear)
-                        pen = QPen(Qt.transparent, self.eraser_width / self.device_pixel_ratio, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                        painter.setPen(pen)
-                        width = self.eraser_width
-                    else:
-                        pen_color_with_opacity = self._get_current_pen_color()
-                        pen = QPen(pen_color_with_opacity, self.pen_width / self.device_pixel_ratio, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                        painter.setPen(pen)
-                        width = self.pen_width
-                    painter.drawPoint(self.last_point)
-                    painter.end()
-                    margin = width // 2 + 2
-                    update_rect = QRect(self.last_point, self.last_point).adjusted(-margin, -margin, margin, margin)
-                    self.update(update_rect)
+                self._begin_stroke(event.pos())
+            self._update_input_shape()
+
+    def _pen_samples(self, event: QTabletEvent) -> PenSamples:
+        samples = PenSamples()
+        samples.add(event.pressure(), event.xTilt(), event.yTilt(), event.timestamp() - self._pen_time_origin)
+        return samples
+
+    def tabletEvent(self, event: QTabletEvent):
+        """
+        觸控筆：手繪、螢光筆與橡皮擦直接處理原生的觸控筆事件，不經過系統合成的滑鼠事件。
+        座標與滑鼠一樣排入 FrameScheduler 每個畫面一次處理；手繪筆劃另外記錄壓力、傾斜與時間，筆寬依壓力變化。
+        其他工具與未按下筆尖的移動則忽略事件，交給 Qt 合成的滑鼠事件處理。
+        """
+        event_type = event.type()
+        stroke_tool = self.current_tool in ['freehand', 'highlighter', 'eraser']
+        if event_type == QEvent.TabletPress and stroke_tool and event.button() == Qt.LeftButton:
+            self._commit_text_input()
+            self.canvas_activated.emit()
+            self.drawing = True
+            self.cursor_pos = event.pos()
+            self._pen_time_origin = event.timestamp()
+            self._begin_stroke(event.pos(), self._pen_samples(event))
+            self._update_input_shape()
+        elif event_type == QEvent.TabletMove and self.drawing and self.current_command is not None:
+            self.cursor_pos = event.pos()
+            self.frame_scheduler.note_event()
+            self.frame_scheduler.queue_point(event.pos())
+            if self._pending_pen_samples is not None:
+                self._pending_pen_samples.add(event.pressure(), event.xTilt(), event.yTilt(),
+                                              event.timestamp() - self._pen_time_origin)
+        elif event_type == QEvent.TabletRelease and self.drawing and self.current_command is not None:
+            self.drawing = False
+            self.frame_scheduler.flush() # 先畫入尚未處理的座標
+            self.update(self._finish_stroke())
+            self._update_input_shape()
+        else:
+            event.ignore()
+            return
+        event.accept()
+
+    def _eraser_preview_rect(self, pos: QPoint, width: int = None) -> QRect:
+        """橡皮擦預覽圓圈在 pos 處所佔的範圍（含虛線筆寬）。"""
+        width = self.eraser_width if width is None else width
+        radius = int(math.ceil(width / self.device_pixel_ratio / 2)) + 2
+        return QRect(pos.x() - radius, pos.y() - radius, 2 * radius + 1, 2 * radius + 1)
+
+    def _update_eraser_preview(self, previous_pos: QPoint = None, previous_width: int = None):
+        """只重繪橡皮擦預覽圓圈新舊位置的聯集；其他工具沒有懸停預覽，不需要重繪。"""
+        if self.current_tool != 'eraser':
+            return
+        dirty_rect = self._eraser_preview_rect(self.cursor_pos)
+        if previous_pos is not None or previous_width is not None:
+            old_pos = self.cursor_pos if previous_pos is None else previous_pos
+            dirty_rect = dirty_rect.united(self._eraser_preview_rect(old_pos, previous_width))
+        self.frame_scheduler.invalidate(dirty_rect)
 
     def leaveEvent(self, event: QEvent):
+        previous_pos = self.cursor_pos
         self.cursor_pos = QPoint(-1, -1)
-        self.update()
+        self._update_eraser_preview(previous_pos)
         super().leaveEvent(event)
 
     def mouseMoveEvent(self, event: QMouseEvent):
-        self.cursor_pos = event.pos()
-        current_pos = event.pos()
-        if (event.buttons() & Qt.LeftButton) and self.drawing:
-            update_rect = QRect()
-            if self.current_tool == 'laser_pointer':
-                self.laser_trail_segments.append((self.last_point, current_pos, 255))
-                self.last_point = current_pos
-                self.update()
-            elif self.current_tool in ['line', 'arrow', 'rectangle', 'crop']:
-                width = self.pen_width + 2
-                r1 = QRect(self.start_point, self.current_point).normalized().adjusted(-width, -width, width, width)
-                if event.modifiers() & Qt.ShiftModifier and self.current_tool == 'rectangle':
-                    self.current_point = self._get_constrained_point(self.start_point, current_pos)
-                else:
-                    self.current_point = current_pos
-                r2 = QRect(self.start_point, self.current_point).normalized().adjusted(-width, -width, width, width)
-                update_rect = r1.united(r2)
-                self.update(update_rect)
-            elif self.current_tool == 'circle':
-                center_x, center_y = self.start_point.x(), self.start_point.y()
-                current_x, current_y = current_pos.x(), current_pos.y()
-
-                if QApplication.keyboardModifiers() & Qt.ShiftModifier:
-                    radius = math.hypot(current_x - center_x, current_y - center_y)
-                    # Bounding box for a perfect circle centered at start_point
-                    update_rect = QRect(
-                        int(center_x - radius), int(center_y - radius),
-                        int(2 * radius), int(2 * radius)
-                    )
-                else:
-                    rx = abs(current_x - center_x)
-                    ry = abs(current_y - center_y)
-                    # Bounding box for an ellipse centered at start_point
-                    update_rect = QRect(
-                        int(center_x - rx), int(center_y - ry),
-                        int(2 * rx), int(2 * ry)
-                    )
-                # Add some margin for pen width
-                width = self.pen_width + 2
-                update_rect = update_rect.adjusted(-width, -width, width, width)
-                self.current_point = current_pos # Update current_point for paintEvent
-                self.update(update_rect)
-            elif self.current_tool == 'highlighter':
-                # Draw directly on self.image for correct opacity blending
-                width = self.pen_width * 2 + 2
-                update_rect = QRect(self.last_point, current_pos).normalized().adjusted(-width, -width, width, width)
-                painter = QPainter(self.image)
-                painter.setRenderHint(QPainter.Antialiasing)
-                highlighter_color = QColor(self.pen_color.red(), self.pen_color.green(), self.pen_color.blue(), 64)
-                pen = QPen(highlighter_color, (self.pen_width * 2) / self.device_pixel_ratio, Qt.SolidLine, Qt.SquareCap, Qt.RoundJoin)
-                painter.setPen(pen)
-                painter.drawLine(self.last_point, current_pos)
-                painter.end()
-                self.last_point = current_pos
-                self.update(update_rect)
-            elif self.current_tool in ['freehand', 'eraser']:
-                width = self.eraser_width if self.current_tool == 'eraser' else self.pen_width
-                margin = width // 2 + 2
-                painter = QPainter(self.image)
-                if self.smoothing_enabled:
-                    painter.setRenderHint(QPainter.Antialiasing)
-                if self.current_tool == 'eraser':
-                    painter.setCompositionMode(QPainter.CompositionMode_Clear)
-                    pen = QPen(Qt.transparent, self.eraser_width / self.device_pixel_ratio, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                else:
-                    pen_color_with_opacity = self._get_current_pen_color()
-                    pen = QPen(pen_color_with_opacity, self.pen_width / self.device_pixel_ratio, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                painter.setPen(pen)
-                if self.current_tool == 'freehand' and self.smoothing_enabled:
-                    self.point_buffer.append(current_pos)
-                    path = QPainterPath()
-                    if len(self.point_buffer) >= 3:
-                        p1, p2, p3 = self.point_buffer[-3:]
-                        mid1 = QPoint((p1.x() + p2.x()) // 2, (p1.y() + p2.y()) // 2)
-                        mid2 = QPoint((p2.x() + p3.x()) // 2, (p2.y() + p3.y()) // 2)
-                        path.moveTo(mid1)
-                        path.quadTo(p2, mid2)
-                        painter.drawPath(path)
-                    update_rect = path.boundingRect().toRect().adjusted(-margin, -margin, margin, margin)
-                else:
-                    update_rect = QRect(self.last_point, current_pos).normalized().adjusted(-margin, -margin, margin, margin)
-                    painter.drawLine(self.last_point, current_pos)
-                painter.end()
-                self.last_point = current_pos
-                self.update(update_rect)
-        else:
-            self.update()
+        previous_pos = self.cursor_pos
+        self.cursor_pos = current_pos = event.pos()
+        # 只計算會排入座標或重繪範圍的事件；其他工具的懸停移動不會產生畫面，不算入合併數
+        if self.drawing and (self.current_command is not None or self.current_tool == 'laser_pointer'):
+            # 筆劃與雷射筆：每個事件只把座標放進佇列，由下一個畫面一次處理整批座標
+            self.frame_scheduler.note_event()
+            self.frame_scheduler.queue_point(current_pos)
+        elif (event.buttons() & Qt.LeftButton) and self._text_drag_pos is not None:
+            delta = current_pos - self._text_drag_pos
+            if self._text_dragging or delta.manhattanLength() >= QApplication.startDragDistance():
+                self._text_dragging = True
+                self._text_drag_pos = current_pos
+                self.frame_scheduler.note_event()
+                self.frame_scheduler.invalidate(self.text_editor.move_by(delta))
+        elif (event.buttons() & Qt.LeftButton) and self.drawing and self.current_tool in PREVIEW_TOOLS:
+            self.preview_shift = bool(event.modifiers() & Qt.ShiftModifier)
+            self.frame_scheduler.note_event()
+            self._update_shape_preview()
+        elif self.current_tool == 'eraser':
+            self.frame_scheduler.note_event()
+            self._update_eraser_preview(previous_pos)
 
     def mouseReleaseEvent(self, event: QMouseEvent):
-        if event.button() == Qt.LeftButton and self.drawing:
+        if event.button() == Qt.LeftButton and self._text_drag_pos is not None:
+            self._text_drag_pos = None
+            self._text_dragging = False
+        elif event.button() == Qt.LeftButton and self.drawing:
+            if self.current_tool == 'laser_pointer':
+                self.frame_scheduler.flush() # 先把尚未處理的座標接上軌跡
             self.drawing = False
-            save_needed = False
+            dirty_region = QRegion()
             if self.current_tool in ['line', 'arrow', 'rectangle', 'circle']:
                 final_point = event.pos()
-                if event.modifiers() & Qt.ShiftModifier and self.current_tool == 'rectangle':
+                shift = bool(event.modifiers() & Qt.ShiftModifier)
+                if shift and self.current_tool == 'rectangle':
                     final_point = self._get_constrained_point(self.start_point, final_point)
                 if self.start_point and self.start_point != final_point:
-                    painter = QPainter(self.image)
-                    painter.setRenderHint(QPainter.Antialiasing)
-                    pen_color_with_opacity = self._get_current_pen_color()
-                    pen = QPen(pen_color_with_opacity, self.pen_width / self.device_pixel_ratio, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                    painter.setPen(pen)
-                    if self.current_tool == 'line':
-                        painter.drawLine(self.start_point, final_point)
-                    elif self.current_tool == 'arrow':
-                        self.draw_arrow(painter, self.start_point, final_point)
-                    elif self.current_tool == 'rectangle':
-                        painter.drawRect(QRect(self.start_point, final_point).normalized())
-                    elif self.current_tool == 'circle':
-                        center_x, center_y = self.start_point.x(), self.start_point.y()
-                        final_x, final_y = final_point.x(), final_point.y()
-
-                        if event.modifiers() & Qt.ShiftModifier:
-                            # Draw a perfect circle (radius is distance from center to final point)
-                            radius = math.hypot(final_x - center_x, final_y - center_y)
-                            painter.drawEllipse(self.start_point, radius, radius)
-                        else:
-                            # Draw an ellipse (rx, ry are distances from center to final point)s
-                            rx = abs(final_x - center_x)
-                            ry = abs(final_y - center_y)
-                            painter.drawEllipse(self.start_point, rx, ry)
+                    command = self._create_shape_command(self.start_point, final_point, shift)
+                    self._touch_history(self._shape_bounding_rect(self.start_point, final_point, shift))
+                    painter = QPainter(self._ensure_ink())
+                    render_command(painter, command)
                     painter.end()
-                    save_needed = True
+                    self._save_history(command)
+                    dirty_region = dirty_region.united(command.bounding_rect())
+                dirty_region = dirty_region.united(self.preview_overlay.clear())
                 self.start_point = None
                 self.current_point = None
             elif self.current_tool == 'crop':
+                self.update(self.preview_overlay.clear()) # 先移除預覽，儲存對話框開啟時畫面上不會殘留虛線框
                 if self.start_point and self.current_point and self.start_point != event.pos():
                     crop_rect = QRect(self.start_point, event.pos()).normalized()
                     self.save_cropped_area(crop_rect)
                 self.toolbar.set_tool_checked('freehand')
                 self.start_point = None
                 self.current_point = None
-            elif self.current_tool in ['freehand', 'eraser']:
-                if self.current_tool == 'freehand' and self.smoothing_enabled:
-                    painter = QPainter(self.image)
-                    if self.smoothing_enabled:
-                        painter.setRenderHint(QPainter.Antialiasing)
-                    pen_color_with_opacity = self._get_current_pen_color()
-                    pen = QPen(pen_color_with_opacity, self.pen_width / self.device_pixel_ratio, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                    painter.setPen(pen)
-                    if len(self.point_buffer) == 1:
-                        painter.drawPoint(self.point_buffer[0])
-                    elif len(self.point_buffer) == 2:
-                        painter.drawLine(self.point_buffer[0], self.point_buffer[1])
-                    painter.end()
-                    self.point_buffer.clear()
-                save_needed = True
-            elif self.current_tool == 'highlighter':
-                # No need to draw highlighter_temp_image, as drawing is direct now.
-                # Just save history and update.
-                save_needed = True # Drawing already happened in mouseMoveEvent
-                self.highlighter_temp_image = None # Clear the reference
-            if save_needed:
-                self._save_history()
-            self.update()
-
-    def paintEvent(self, event):
-        if self.width() <= 0 or self.height() <= 0:
-            return
-
-        painter = QPainter(self)
-        painter.setClipRect(event.rect()) # --- 效能優化：設定剪裁區域 ---
-
-        # --- Brute-force clear to fight rendering ghosts ---
-        # On some systems, changing transparency attributes can leave stale images.
-        # We start by clearing the entire widget area to full transparency.
-        # This acts as a reset before every paint.
-        painter.setCompositionMode(QPainter.CompositionMode_Clear)
-        painter.fillRect(self.rect(), Qt.transparent)
-        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
-        # --- End of clear ---
-
-        painter.setRenderHint(QPainter.Antialiasing)
-        painter.setRenderHint(QPainter.SmoothPixmapTransform)
-
-        # Now, draw the correct background based on the current mode
+            elif self.current_tool == 'pass_through':
+                dirty_region = dirty_region.united(self.preview_overlay.clear())
+                if self.start_point and self.start_point != event.pos():
+                    region_rect = QRect(self.start_point, event.pos()).normalized().intersected(self.rect())
+                    self.set_pass_through_regions(self.pass_through_regions + [region_rect])
+                else:
+                    self.set_pass_through_regions([]) # 點一下 (沒有拖曳) 清除所有穿透區域
+                self.start_point = None
+                self.current_point = None
+            elif self.current_tool in ['freehand', 'highlighter', 'eraser'] and self.current_command:
+                self.frame_scheduler.flush() # 先畫入尚未處理的座標
+                dirty_region = dirty_region.united(self._finish_stroke())
+            # 雷射筆軌跡由淡出計時器自行重繪
+            self.update(dirty_region)
+            self._update_input_shape()
+
+    def _update_shape_preview(self):
+        """依目前的起點、終點與 Shift 狀態更新拉線預覽，只重繪新舊預覽線條經過的區域。"""
+        if self.preview_shift and self.current_tool == 'rectangle':
+            self.current_point = self._get_constrained_point(self.start_point, self.cursor_pos)
+        else:
+            self.current_point = self.cursor_pos
+        if self.current_tool == 'crop':
+            preview_pen = QPen(QColor(0, 120, 255), 2 / self.device_pixel_ratio, Qt.DashLine)
+        elif self.current_tool == 'pass_through':
+            preview_pen = QPen(PASS_THROUGH_OUTLINE_COLOR, 2 / self.device_pixel_ratio, Qt.DashLine)
+        else:
+            preview_pen = QPen(self._get_current_pen_color(), self.pen_width / self.device_pixel_ratio, Qt.DashLine)
+        dirty_region = self.preview_overlay.set_shape(self.current_tool, self.start_point, self.current_point, preview_pen,
+                                                      self.preview_shift, self._get_arrow_size())
+        self.frame_scheduler.invalidate(dirty_region)
+
+    def _static_layer_state(self) -> tuple:
+        """回傳決定靜態圖層內容的所有狀態；任何一項改變都需要重建圖層。"""
+        background = self.background_pixmap if self.canvas_mode == 'desktop' else None
+        loaded = self.loaded_background_image if self.canvas_mode == 'file' else None
+        return (self.canvas_mode, self.canvas_color.rgba(), self.pattern_mode,
+                background.cacheKey() if background else 0,
+                loaded.cacheKey() if loaded else 0,
+                self.size(), self.device_pixel_ratio, self._input_shaping_active(),
+                tuple((rect.x(), rect.y(), rect.width(), rect.height()) for rect in self.pass_through_regions))
+
+    def _is_opaque_canvas(self) -> bool:
+        """靜態圖層是否會完全覆蓋整個視窗（半透明模式或含透明度的圖片則否）。"""
+        if self.canvas_mode in ['blackboard', 'whiteboard', 'solid']:
+            return self.canvas_color.alpha() == 255
+        if self.canvas_mode == 'desktop':
+            return bool(self.background_pixmap) and not self.background_pixmap.isNull()
+        if self.canvas_mode == 'file':
+            image = self.loaded_background_image
+            return bool(image) and not image.isNull() and not image.hasAlphaChannel()
+        return False
+
+    def _paint_background(self, painter: QPainter, for_display: bool = True):
+        """畫出目前畫布模式的背景；背景圖片已預先縮放成畫布大小，因此以原點 1:1 繪製。"""
         if self.canvas_mode == 'desktop':
             if self.background_pixmap and not self.background_pixmap.isNull():
-                painter.drawPixmap(self.rect(), self.background_pixmap)
+                painter.drawPixmap(QPoint(0, 0), self.background_pixmap)
         elif self.canvas_mode in ['blackboard', 'whiteboard', 'solid']:
             painter.fillRect(self.rect(), self.canvas_color)
         elif self.canvas_mode == 'transparent':
-            # The clearing at the top makes the background transparent.
-            # We need to paint a near-invisible color to capture mouse events.
-            painter.fillRect(self.rect(), QColor(0, 0, 0, 5))
+            if for_display:
+                # We need to paint a near-invisible color to capture mouse events.
+                # 依輸入外形模式只填入擷取輸入的區域，穿透區域保持完全透明
+                capture = self._capture_region() if self._input_shaping_active() else QRegion(self.rect())
+                for rect in capture.rects():
+                    painter.fillRect(rect, QColor(0, 0, 0, 5))
+                if self._input_shaping_active():
+                    # 虛線框畫在穿透區域外側一個像素，位於擷取輸入的範圍內，讓使用者看得到穿透的位置
+                    outline_pen = QPen(PASS_THROUGH_OUTLINE_COLOR, 1, Qt.DashLine)
+                    outline_pen.setCosmetic(True)
+                    painter.save()
+                    painter.setRenderHint(QPainter.Antialiasing, False)
+                    painter.setPen(outline_pen)
+                    painter.setBrush(Qt.NoBrush)
+                    for rect in self.pass_through_regions:
+                        painter.drawRect(rect.adjusted(-1, -1, 0, 0))
+                    painter.restore()
         elif self.canvas_mode == 'file' and self.loaded_background_image:
-            painter.drawPixmap(self.rect(), self.loaded_background_image)
+            painter.drawPixmap(QPoint(0, 0), self.loaded_background_image)
+
+    def _ensure_static_layer(self) -> QPixmap:
+        """取得背景加格線的快取圖層，只有在相關狀態改變時才重建。"""
+        state = self._static_layer_state()
+        if self.static_layer is None or state != self._static_layer_state_key:
+            layer = QPixmap(self.size() * self.device_pixel_ratio)
+            layer.setDevicePixelRatio(self.device_pixel_ratio)
+            layer.fill(Qt.transparent)
+            painter = QPainter(layer)
+            painter.setRenderHint(QPainter.Antialiasing)
+            self._paint_background(painter)
+            self.draw_pattern(painter)
+            painter.end()
+            self.static_layer = layer
+            self._static_layer_state_key = state
+            self._static_layer_opaque = self._is_opaque_canvas()
+            # 不透明畫布會自行覆蓋所有像素，告訴 Qt 不必先清除或繪製視窗背景
+            self.setAttribute(Qt.WA_OpaquePaintEvent, self._static_layer_opaque)
+            self.memory_registry.track(self, "static_layer", self.static_layer)
+        return self.static_layer
+
+    def _blit_layer(self, painter: QPainter, layer, rect: QRect):
+        """將圖層 (QPixmap 或 QImage) 中與 rect 對應的像素 1:1 複製到畫面上。"""
+        dpr = layer.devicePixelRatio()
+        source = QRectF(rect.x() * dpr, rect.y() * dpr, rect.width() * dpr, rect.height() * dpr)
+        if isinstance(layer, QImage):
+            painter.drawImage(QRectF(rect), layer, source)
+        else:
+            painter.drawPixmap(QRectF(rect), layer, source)
 
-        self.draw_pattern(painter)
-        if self.image and not self.image.isNull():
-            painter.drawPixmap(self.rect(), self.image)
+    def _ink_lock(self):
+        """讀取筆跡圖層時持有的鎖；沒有背景執行緒時不需要上鎖。"""
+        return self.stroke_rasterizer.lock if self.stroke_rasterizer is not None else contextlib.nullcontext()
 
-        
+    def _paint_overlay(self, painter: QPainter):
+        """畫出筆跡上方的暫時內容：繪製中的螢光筆、拉線預覽、編輯中的文字、雷射筆軌跡與橡皮擦預覽圓圈。"""
+        if isinstance(self.stroke_session, HighlighterSession):
+            with self._ink_lock():
+                self.stroke_session.paint_layer(painter)
+        self.preview_overlay.paint(painter)
+        self.text_editor.paint(painter)
 
-        if self.drawing and self.start_point and self.current_point:
-            pen_color_with_opacity = self._get_current_pen_color()
-            preview_pen = QPen(QColor(0, 120, 255), 2 / self.device_pixel_ratio, Qt.DashLine) if self.current_tool == 'crop' else QPen(pen_color_with_opacity, self.pen_width / self.device_pixel_ratio, Qt.DashLine)
-            painter.setPen(preview_pen)
-            if self.current_tool == 'line':
-                painter.drawLine(self.start_point, self.current_point)
-            elif self.current_tool == 'arrow':
-                self.draw_arrow(painter, self.start_point, self.current_point)
-            elif self.current_tool in ['rectangle', 'crop']:
-                rect = QRect(self.start_point, self.current_point).normalized()
-                painter.drawRect(rect)
-            elif self.current_tool == 'circle':
-                center_x, center_y = self.start_point.x(), self.start_point.y()
-                current_x, current_y = self.current_point.x(), self.current_point.y()
-
-                if QApplication.keyboardModifiers() & Qt.ShiftModifier:
-                    # Draw a perfect circle (radius is distance from center to current point)
-                    radius = math.hypot(current_x - center_x, current_y - center_y)
-                    painter.drawEllipse(self.start_point, radius, radius)
-                else:
-                    # Draw an ellipse (rx, ry are distances from center to current point)
-                    rx = abs(current_x - center_x)
-                    ry = abs(current_y - center_y)
-                    painter.drawEllipse(self.start_point, rx, ry)
-
-        if self.laser_trail_segments:
-            num_segments = len(self.laser_trail_segments)
-            max_width = self.pen_width / self.device_pixel_ratio # 調整雷射筆的最大寬度
-            taper_length = min(15, num_segments // 2)
-            for i, (start_p, end_p, opacity) in enumerate(self.laser_trail_segments):
-                if taper_length > 0:
-                    if i < taper_length:
-                        current_width = max(1.0 / self.device_pixel_ratio, max_width * ((i + 1) / taper_length))
-                    elif i >= num_segments - taper_length:
-                        current_width = max(1.0 / self.device_pixel_ratio, max_width * ((num_segments - i) / taper_length))
-                    else:
-                        current_width = max_width
-                else:
-                    current_width = max_width
-                color = self.pen_color
-                laser_pen = QPen(QColor(color.red(), color.green(), color.blue(), opacity), current_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                painter.setPen(laser_pen)
-                painter.drawLine(start_p, end_p)
+        if self.laser_trail:
+            self._draw_laser_trail(painter, self.quality_governor)
 
         if self.current_tool == 'eraser' and self.rect().contains(self.cursor_pos):
             radius = (self.eraser_width / self.device_pixel_ratio) / 2 # 調整橡皮擦預覽圓圈的半徑
@@ -789,23 +1253,167 @@ class ScreenDrawWindow(QWidget):
             painter.setBrush(Qt.NoBrush)
             painter.drawEllipse(self.cursor_pos, radius, radius)
 
+    def _frame_painted(self, paint_start: float):
+        """兩種渲染器畫完一個畫面後呼叫，將繪製時間回報給品質調節器。"""
+        if self.drawing:
+            self.quality_governor.frame_rendered((time.perf_counter() - paint_start) * 1000.0 + self._stroke_raster_ms)
+        self._stroke_raster_ms = 0.0
+
+    def paintEvent(self, event):
+        if self.width() <= 0 or self.height() <= 0 or not self.renderer.paints_window():
+            return
+        paint_start = time.perf_counter()
+        governor = self.quality_governor
+
+        painter = QPainter(self)
+        painter.setClipRegion(event.region()) # --- 效能優化：設定剪裁區域 ---
+
+        static_layer = self._ensure_static_layer()
+        if not self._static_layer_opaque:
+            # --- Brute-force clear to fight rendering ghosts ---
+            # On some systems, changing transparency attributes can leave stale images.
+            # Only non-opaque canvases need this: opaque ones overwrite every pixel below.
+            painter.setCompositionMode(QPainter.CompositionMode_Clear)
+            painter.fillRect(self.rect(), Qt.transparent)
+            painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            # --- End of clear ---
+
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, governor.smooth_blits())
+
+        # 背景與格線來自快取的靜態圖層，筆跡圖層也只複製需要重繪的範圍
+        has_ink = self.image is not None and not self.image.isNull()
+        ink_lock = self._ink_lock()
+        for rect in event.region().rects():
+            if self._static_layer_opaque:
+                # 不透明圖層直接覆蓋，不需要與舊內容混色
+                painter.setCompositionMode(QPainter.CompositionMode_Source)
+                self._blit_layer(painter, static_layer, rect)
+                painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            else:
+                self._blit_layer(painter, static_layer, rect)
+            if has_ink:
+                with ink_lock: # 背景執行緒畫完一批線段之前不會讀到一半的筆跡
+                    self._blit_layer(painter, self.image, rect)
+
+        self._paint_overlay(painter)
+        painter.end()
+        self._frame_painted(paint_start)
+
+    def _draw_laser_trail(self, painter: QPainter, governor: QualityGovernor):
+        """畫出雷射筆軌跡：透明度與粗細都依線段的經過時間遞減，越舊的線段越細越淡；整條軌跡共用同一支畫筆。"""
+        max_width = self.pen_width / self.device_pixel_ratio # 調整雷射筆的最大寬度
+        min_width = 1.0 / self.device_pixel_ratio
+        taper_steps = governor.laser_taper_steps()
+        fast_laser = not governor.antialias_laser()
+        color = QColor(self.pen_color)
+        pen = QPen(color, max_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+        if fast_laser:
+            painter.setRenderHint(QPainter.Antialiasing, False)
+        batch_key, batch_lines = None, []
+        for x1, y1, x2, y2, life in self.laser_trail.segments(time.monotonic()):
+            opacity = int(255 * life)
+            # 粗細依剩餘壽命分成 taper_steps 級，同一級的線段共用同一個寬度
+            current_width = max(min_width, max_width * math.ceil(life * taper_steps) / taper_steps)
+            if fast_laser:
+                # 降級時將透明度量化，並把粗細與透明度相同的連續線段合併成一次 drawLines
+                opacity &= 0xF0
+                if (current_width, opacity) != batch_key:
+                    self._draw_laser_batch(painter, pen, color, batch_key, batch_lines)
+                    batch_key, batch_lines = (current_width, opacity), []
+                batch_lines.append(QLine(x1, y1, x2, y2))
+                continue
+            color.setAlpha(opacity)
+            pen.setColor(color)
+            pen.setWidthF(current_width)
+            painter.setPen(pen)
+            painter.drawLine(x1, y1, x2, y2)
+        if fast_laser:
+            self._draw_laser_batch(painter, pen, color, batch_key, batch_lines)
+            painter.setRenderHint(QPainter.Antialiasing, True)
+
+    def _draw_laser_batch(self, painter: QPainter, pen: QPen, color: QColor, key: tuple, lines: list):
+        if not lines:
+            return
+        width, opacity = key
+        color.setAlpha(opacity)
+        pen.setColor(color)
+        pen.setWidthF(width)
+        painter.setPen(pen)
+        painter.drawLines(lines)
+
+    def event(self, event):
+        if (event.type() == QEvent.ShortcutOverride and self.text_editor.is_active()
+                and event.key() != Qt.Key_Escape):
+            # 編輯文字時數字鍵、方向鍵與 Delete 交給文字方塊，不觸發工具與復原的快捷鍵
+            event.accept()
+            return True
+        return super().event(event)
+
     def keyPressEvent(self, event):
+        if self.text_editor.is_active():
+            if event.key() == Qt.Key_Escape:
+                self._commit_text_input()
+                return
+            dirty_region = self.text_editor.key_press(event)
+            if dirty_region is not None:
+                self.update(dirty_region)
+                self.text_caret_timer.start() # 重新開始閃爍週期，輸入時游標保持顯示
+                QApplication.inputMethod().update(Qt.ImCursorRectangle)
+                return
         if event.key() == Qt.Key_Escape:
             self.end_drawing_mode()
+        elif event.key() == Qt.Key_Shift:
+            self._handle_shift_change(True)
+
+    def inputMethodEvent(self, event):
+        if self.text_editor.is_active():
+            self.update(self.text_editor.input_method_event(event))
+            event.accept()
+        else:
+            super().inputMethodEvent(event)
+
+    def inputMethodQuery(self, query):
+        if self.text_editor.is_active():
+            value = self.text_editor.input_method_query(query)
+            if value is not None:
+                return value
+        return super().inputMethodQuery(query)
+
+    def keyReleaseEvent(self, event):
+        if event.key() == Qt.Key_Shift:
+            self._handle_shift_change(False)
+        super().keyReleaseEvent(event)
+
+    def _handle_shift_change(self, pressed: bool):
+        """拖曳中按下或放開 Shift 時，不必等滑鼠移動就更新預覽。"""
+        if self.drawing and self.start_point and self.current_tool in PREVIEW_TOOLS and self.preview_shift != pressed:
+            self.preview_shift = pressed
+            self._update_shape_preview()
 
     def resizeEvent(self, event):
         new_size = self.size()
-        if self.image.size() != new_size and new_size.isValid() and new_size.width() > 0 and new_size.height() > 0:
+        if self.image is not None and self.image.size() != new_size * self.device_pixel_ratio and new_size.isValid() and new_size.width() > 0 and new_size.height() > 0:
+            self._sync_ink()
             old_image = self.image
-            self.image = QPixmap(new_size)
-            self.image.fill(Qt.transparent)
+            self.image = self._new_ink_image(new_size)
             painter = QPainter(self.image)
-            painter.drawPixmap(QPoint(0, 0), old_image)
+            painter.drawImage(QPoint(0, 0), old_image)
             painter.end()
+            if self.stroke_session is not None:
+                self.stroke_session.set_target(self.image)
+            self._ink_region_tracking = False
+        if new_size.isValid() and not new_size.isEmpty():
+            # 筆跡圖層在第一次畫記時才配置，背景圖片不論是否已有筆跡都要配合新的大小
+            self.background_pixmap = self._fit_background(self.background_pixmap)
+            self.loaded_background_image = self._fit_background(self.loaded_background_image)
+            self._track_buffers()
+        self.renderer.resize(new_size)
+        self._update_input_shape()
         super().resizeEvent(event)
 
     def wheelEvent(self, event: QWheelEvent):
-        if QApplication.keyboardModifiers() == Qt.NoModifier:
+        if event.modifiers() == Qt.NoModifier:
             delta = event.angleDelta().y()
             step = 1
             if self.current_tool == 'eraser':
@@ -814,6 +1422,7 @@ class ScreenDrawWindow(QWidget):
                 if new_width != self.eraser_width:
                     self.eraser_width = new_width
                     self.toolbar.set_width_value(self.eraser_width)
+                    self._update_eraser_preview(previous_width=current_width)
             else:
                 current_width = self.pen_width
                 new_width = min(current_width + step, 50) if delta > 0 else max(current_width - step, 1)
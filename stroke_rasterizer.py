@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import deque
+from PyQt5.QtCore import QObject, QRect, pyqtSignal
+
+
+class StrokeRasterizer(QObject):
+    """
+    在專用的背景執行緒中將筆劃線段畫入筆跡圖層 (premultiplied ARGB 的 QImage)。
+    GUI 執行緒只把每個畫面累積的座標放進佇列 (collections.deque 的 append/popleft 不需要額外上鎖)，
+    背景執行緒畫完一批後以 rect_ready 通知需要重繪的範圍；GUI 執行緒只負責複製畫好的區域，
+    因此再粗的橡皮擦或螢光筆也不會卡住輸入處理。
+
+    筆劃進行中，目前的 StrokeSession (及其 DrawCommand) 只由背景執行緒加入座標；
+    GUI 執行緒在讀寫筆跡圖層或提交筆劃之前必須先呼叫 sync()。
+    """
+    rect_ready = pyqtSignal(QRect)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.lock = threading.Lock()  # 繪製一批線段時持有；重繪複製筆跡圖層時也要取得
+        self.last_batch_ms = 0.0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._done = threading.Condition()
+        self._submitted = 0  # 只由 GUI 執行緒遞增
+        self._completed = 0  # 只由背景執行緒遞增
+        self._dirty_rect = QRect()
+        self._thread = threading.Thread(target=self._run, name="stroke-raster", daemon=True)
+        self._thread.start()
+
+    def submit(self, session, points, antialias: bool = None, samples=None):
+        """將一串座標 (x0, y0, x1, y1, ...) 排入佇列，由背景執行緒透過 session 加入筆劃並畫入筆跡圖層。"""
+        self._submitted += 1
+        self._queue.append((session, points, antialias, samples))
+        self._wakeup.set()
+
+    def sync(self):
+        """等待佇列中的線段全部畫完。"""
+        with self._done:
+            self._done.wait_for(lambda: self._completed >= self._submitted)
+
+    def take_dirty_rect(self) -> QRect:
+        """sync() 之後呼叫：取出並清除自上次取出後畫過的範圍，供復原紀錄使用。"""
+        rect = self._dirty_rect
+        self._dirty_rect = QRect()
+        return rect
+
+    def stop(self):
+        self._queue.append(None)
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                item = self._queue.popleft()
+                if item is None:
+                    return
+                rect = self._rasterize(*item)
+                with self._done:
+                    self._dirty_rect = self._dirty_rect.united(rect)
+                    self._completed += 1
+                    self._done.notify_all()
+                if not rect.isEmpty():
+                    self.rect_ready.emit(rect)
+
+    def _rasterize(self, session, points, antialias: bool, samples) -> QRect:
+        start = time.perf_counter()
+        with self.lock:
+            update_rect = session.add_points(points, antialias, samples)
+        self.last_batch_ms = (time.perf_counter() - start) * 1000.0
+        return update_rect
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def qapp(tmp_path_factory):
+    """整個測試共用一個 QApplication；QSettings 寫到暫存的 HOME，不影響使用者的設定。"""
+    os.environ["HOME"] = str(tmp_path_factory.mktemp("home"))
+    os.environ["XDG_CONFIG_HOME"] = os.path.join(os.environ["HOME"], ".config")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    yield app
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# QT_SCALE_FACTOR 必須在建立 QApplication 前設定，因此每個 DPR 在獨立的行程中執行
+HIGHLIGHTER_REPLAY = textwrap.dedent("""
+    import sys
+    from PyQt5.QtCore import Qt, QEvent, QPointF
+    from PyQt5.QtGui import QMouseEvent
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication([])
+    from screen_draw import ScreenDrawWindow
+
+    def send(window, kind, point):
+        button = Qt.NoButton if kind == QEvent.MouseMove else Qt.LeftButton
+        buttons = Qt.NoButton if kind == QEvent.MouseButtonRelease else Qt.LeftButton
+        QApplication.sendEvent(window, QMouseEvent(kind, QPointF(*point), button, buttons, Qt.NoModifier))
+
+    window = ScreenDrawWindow()
+    window.toggle_drawing_mode(True)
+    app.processEvents()
+    window.handle_tool_change('highlighter')
+    points = [(100, 100), (300, 100), (200, 50), (200, 150), (150, 100)]
+    send(window, QEvent.MouseButtonPress, points[0])
+    for point in points[1:]:
+        send(window, QEvent.MouseMove, point)
+        app.processEvents()
+    send(window, QEvent.MouseButtonRelease, points[-1])
+    app.processEvents()
+    live = window.image.copy()
+    window.undo()
+    window.redo()
+    print(window.image.devicePixelRatio())
+    sys.exit(0 if window.image == live else 1)
+""")
+
+
+@pytest.mark.parametrize("scale_factor", ["1", "1.25", "1.5", "2"])
+def test_highlighter_replay_matches_live_stroke(tmp_path, scale_factor):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", QT_SCALE_FACTOR=scale_factor,
+               HOME=str(tmp_path), XDG_CONFIG_HOME=str(tmp_path / ".config"), PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, "-c", HIGHLIGHTER_REPLAY], env=env, cwd=ROOT,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert float(result.stdout.split()[-1]) == float(scale_factor)
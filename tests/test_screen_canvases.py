@@ -0,0 +1,37 @@
+from PyQt5 import sip
+from PyQt5.QtCore import QEventLoop, QTimer
+
+
+class _RemovedScreen:
+    """代表已拔除的螢幕；offscreen 平台只有一個螢幕，無法真的觸發 screenRemoved。"""
+
+
+def _drain_deferred_deletes():
+    loop = QEventLoop()
+    QTimer.singleShot(50, loop.quit)
+    loop.exec_()
+
+
+def test_removing_primary_screen_promotes_surviving_canvas(qapp, tmp_path):
+    from screen_canvases import ScreenCanvasGroup
+    group = ScreenCanvasGroup()
+    group._add_screen(qapp.primaryScreen())
+    old_primary, survivor = group.canvases
+    old_primary.target_screen = _RemovedScreen()
+    hibernated = tmp_path / "canvas.ink"
+    hibernated.write_bytes(b"ink")
+    old_primary.hibernated_ink_path = str(hibernated)
+    toolbar = old_primary.toolbar
+
+    group._remove_screen(old_primary.target_screen)
+
+    assert group.canvases == [survivor]
+    assert group.primary is survivor and group.active_canvas is survivor
+    assert survivor.owns_toolbar and toolbar.parent() is survivor
+    assert old_primary.stroke_rasterizer is None
+    assert old_primary.history._executor._shutdown
+    assert not hibernated.exists()
+    _drain_deferred_deletes()
+    assert sip.isdeleted(old_primary)
+    assert not sip.isdeleted(toolbar)
+    group.shutdown()
@@ -0,0 +1,25 @@
+from PyQt5.QtCore import QSize
+from PyQt5.QtGui import QColor, QPixmap
+
+
+def test_resize_before_first_stroke_refits_background(qapp):
+    from screen_draw import ScreenDrawWindow
+    window = ScreenDrawWindow()
+    window.show()  # 隱藏的視窗要到顯示時才會收到 resizeEvent
+    window.resize(QSize(800, 600))
+    qapp.processEvents()
+    background = QPixmap(800, 600)
+    background.fill(QColor("#3366CC"))
+    window.loaded_background_image = window._fit_background(background)
+    window.canvas_mode = 'file'
+    assert window.image is None  # 尚未畫記，筆跡圖層還沒有配置
+
+    window.resize(QSize(1200, 900))
+    qapp.processEvents()
+
+    expected = QSize(1200, 900) * window.device_pixel_ratio
+    assert window.loaded_background_image.size() == expected
+    frame = window.grab().toImage()
+    assert QColor(frame.pixel(1100, 850)) == QColor("#3366CC")
+    window.hide()
+    window.deleteLater()
@@ -0,0 +1,330 @@
+from PyQt5.QtCore import Qt, QPoint, QPointF, QRect
+from PyQt5.QtGui import QColor, QFont, QKeySequence, QPainter, QPen, QRegion, QTextCharFormat, QTextLayout
+from PyQt5.QtWidgets import QApplication
+
+from draw_commands import text_line_height
+
+
+def _utf16_length(text: str) -> int:
+    """QTextLayout 的游標位置以 UTF-16 計算，與 Python 字串索引在表情符號等字元上不同。"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _index_from_utf16(text: str, position: int) -> int:
+    index = 0
+    for char in text:
+        if position <= 0:
+            break
+        position -= 2 if ord(char) > 0xFFFF else 1
+        index += 1
+    return index
+
+
+class CanvasTextEditor:
+    """
+    直接在畫布上編輯的文字方塊，取代每次點擊都建立的 QLineEdit 子元件。
+    每一行以一個 QTextLayout 排版並快取，只有內容改變的那一行會重新排版；
+    虛線外框、選取範圍與插入游標由視窗在預覽圖層中畫出，每次編輯回傳需要重繪的區域。
+    支援多行 (Enter 換行)、方向鍵與 Shift 選取、剪貼簿以及輸入法組字。
+    """
+    PADDING = 4
+    MIN_WIDTH = 100
+    CARET_WIDTH = 2
+
+    def __init__(self):
+        self.active = False
+        self.origin = QPoint()
+        self.font = QFont()
+        self.color = QColor()
+        self.caret_visible = True
+        self.preedit = ''
+        self._lines = ['']
+        self._layouts = [None]
+        self._cursor = (0, 0)  # (行, 字元索引)
+        self._anchor = (0, 0)  # 選取範圍的另一端；與 _cursor 相同時沒有選取
+        self._rect = QRect()
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def text(self) -> str:
+        return '\n'.join(self._lines)
+
+    def rect(self) -> QRect:
+        return QRect(self._rect)
+
+    def contains(self, pos: QPoint) -> bool:
+        return self.active and self._rect.contains(pos)
+
+    def begin(self, pos: QPoint, font: QFont, color: QColor) -> QRegion:
+        """在 pos 開始一個新的文字方塊，回傳需要重繪的區域。"""
+        self.active = True
+        self.origin = QPoint(pos)
+        self.font = QFont(font)
+        self.color = QColor(color)
+        self.caret_visible = True
+        self.preedit = ''
+        self._lines = ['']
+        self._layouts = [None]
+        self._cursor = self._anchor = (0, 0)
+        return self._changed()
+
+    def finish(self):
+        """結束編輯，回傳 (文字, 文字的範圍, 需要重繪的區域)；文字的範圍不含外框的內距。"""
+        text = self.text()
+        origin = self._text_origin().toPoint()
+        text_rect = QRect(origin.x(), origin.y(), int(self._text_width()) + 1, text_line_height(self.font) * len(self._lines))
+        self.active = False
+        self.preedit = ''
+        self._lines = ['']
+        self._layouts = [None]
+        self._cursor = self._anchor = (0, 0)
+        return text, text_rect, self._changed()
+
+    def set_font(self, font: QFont) -> QRegion:
+        self.font = QFont(font)
+        self._layouts = [None] * len(self._lines)
+        return self._changed()
+
+    def set_color(self, color: QColor) -> QRegion:
+        self.color = QColor(color)
+        return self._changed()
+
+    def move_by(self, delta: QPoint) -> QRegion:
+        """拖曳移動整個文字方塊。"""
+        self.origin += delta
+        return self._changed()
+
+    def blink(self) -> QRegion:
+        """切換插入游標的顯示，只回傳游標所在的範圍。"""
+        self.caret_visible = not self.caret_visible
+        return QRegion(self.caret_rect())
+
+    def set_cursor_at(self, pos: QPoint, extend: bool = False) -> QRegion:
+        """將插入游標移到 pos 所在的字元；extend 為 True 時 (按住 Shift) 延伸選取範圍。"""
+        origin = self._text_origin()
+        row = int((pos.y() - origin.y()) // text_line_height(self.font))
+        row = max(0, min(row, len(self._lines) - 1))
+        self._move_cursor((row, self._column_at(row, pos.x() - origin.x())), extend)
+        return self._changed()
+
+    def caret_rect(self) -> QRect:
+        if not self.active:
+            return QRect()
+        origin = self._text_origin()
+        row, column = self._cursor
+        x = self._x_of(row, column + len(self.preedit))
+        line_height = text_line_height(self.font)
+        return QRect(int(origin.x() + x) - 1, int(origin.y()) + row * line_height, self.CARET_WIDTH + 2, line_height)
+
+    def key_press(self, event) -> QRegion:
+        """處理按鍵，回傳需要重繪的區域；不是文字方塊處理的按鍵時回傳 None。"""
+        key = event.key()
+        extend = bool(event.modifiers() & Qt.ShiftModifier)
+        row, column = self._cursor
+        if event.matches(QKeySequence.SelectAll):
+            self._anchor = (0, 0)
+            self._cursor = (len(self._lines) - 1, len(self._lines[-1]))
+        elif event.matches(QKeySequence.Copy):
+            self._copy_selection()
+        elif event.matches(QKeySequence.Cut):
+            self._copy_selection()
+            self._delete_selection()
+        elif event.matches(QKeySequence.Paste):
+            self.insert(QApplication.clipboard().text())
+        elif key in (Qt.Key_Return, Qt.Key_Enter):
+            self.insert('\n')
+        elif key == Qt.Key_Backspace:
+            if not self._has_selection():
+                self._move_cursor(self._step(-1), True)
+            self._delete_selection()
+        elif key == Qt.Key_Delete:
+            if not self._has_selection():
+                self._move_cursor(self._step(1), True)
+            self._delete_selection()
+        elif key == Qt.Key_Left:
+            self._move_cursor(self._step(-1), extend)
+        elif key == Qt.Key_Right:
+            self._move_cursor(self._step(1), extend)
+        elif key in (Qt.Key_Up, Qt.Key_Down):
+            target = row + (-1 if key == Qt.Key_Up else 1)
+            if 0 <= target < len(self._lines):
+                self._move_cursor((target, self._column_at(target, self._x_of(row, column))), extend)
+            else:
+                self._move_cursor((row, 0 if key == Qt.Key_Up else len(self._lines[row])), extend)
+        elif key == Qt.Key_Home:
+            self._move_cursor((row, 0), extend)
+        elif key == Qt.Key_End:
+            self._move_cursor((row, len(self._lines[row])), extend)
+        elif event.text() and event.text().isprintable():
+            self.insert(event.text())
+        else:
+            return None
+        self.caret_visible = True
+        return self._changed()
+
+    def insert(self, text: str):
+        """以 text 取代選取範圍 (沒有選取時在游標處插入)；text 可以包含換行。"""
+        self._delete_selection()
+        parts = text.replace('\r\n', '\n').replace('\r', '\n').replace('\u2029', '\n').split('\n')
+        row, column = self._cursor
+        line = self._lines[row]
+        head, tail = line[:column], line[column:]
+        new_lines = [head + parts[0]] + parts[1:]
+        new_lines[-1] += tail
+        self._replace_lines(row, row + 1, new_lines)
+        self._cursor = self._anchor = (row + len(parts) - 1, len(new_lines[-1]) - len(tail))
+
+    def input_method_event(self, event) -> QRegion:
+        """處理輸入法：送出的文字插入游標處，組字中的文字畫在游標後並加上底線。"""
+        if event.commitString():
+            self.insert(event.commitString())
+        self.preedit = event.preeditString()
+        self._layouts[self._cursor[0]] = None
+        self.caret_visible = True
+        return self._changed()
+
+    def input_method_query(self, query):
+        if query == Qt.ImEnabled:
+            return True
+        if query == Qt.ImCursorRectangle:
+            return self.caret_rect()
+        if query == Qt.ImFont:
+            return self.font
+        if query == Qt.ImCursorPosition:
+            return _utf16_length(self._lines[self._cursor[0]][:self._cursor[1]])
+        if query == Qt.ImSurroundingText:
+            return self._lines[self._cursor[0]]
+        return None
+
+    def paint(self, painter: QPainter):
+        if not self.active:
+            return
+        painter.save()
+        pen = QPen(self.color, 1, Qt.DashLine)
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(QRect(self._rect).adjusted(0, 0, -1, -1))
+        painter.setPen(self.color)
+        origin = self._text_origin()
+        line_height = text_line_height(self.font)
+        selection_start, selection_end = sorted((self._cursor, self._anchor))
+        for row in range(len(self._lines)):
+            position = QPointF(origin.x(), origin.y() + row * line_height)
+            layout = self._layout(row)
+            selections = []
+            if selection_start != selection_end and selection_start[0] <= row <= selection_end[0]:
+                line = self._lines[row]
+                start = selection_start[1] if row == selection_start[0] else 0
+                end = selection_end[1] if row == selection_end[0] else len(line)
+                selection = QTextLayout.FormatRange()
+                selection.start = _utf16_length(line[:start])
+                selection.length = _utf16_length(line[start:end])
+                highlight = QTextCharFormat()
+                highlight.setBackground(QColor(0, 120, 255, 128))
+                selection.format = highlight
+                selections.append(selection)
+            layout.draw(painter, position, selections)
+        if self.caret_visible:
+            # QTextLayout.drawCursor 以反相繪製，在透明畫布上看不出顏色，改用文字顏色畫出插入游標
+            caret = self.caret_rect()
+            painter.fillRect(caret.x() + 1, caret.y(), self.CARET_WIDTH, caret.height(), self.color)
+        painter.restore()
+
+    def _text_origin(self) -> QPointF:
+        return QPointF(self.origin.x() + self.PADDING, self.origin.y() + self.PADDING)
+
+    def _display_text(self, row: int) -> str:
+        line = self._lines[row]
+        if self.preedit and row == self._cursor[0]:
+            column = self._cursor[1]
+            return line[:column] + self.preedit + line[column:]
+        return line
+
+    def _layout(self, row: int) -> QTextLayout:
+        layout = self._layouts[row]
+        if layout is None:
+            text = self._display_text(row)
+            layout = QTextLayout(text, self.font)
+            layout.setCacheEnabled(True)
+            if self.preedit and row == self._cursor[0]:
+                underline = QTextLayout.FormatRange()
+                underline.start = _utf16_length(text[:self._cursor[1]])
+                underline.length = _utf16_length(self.preedit)
+                underline.format = QTextCharFormat()
+                underline.format.setFontUnderline(True)
+                layout.setFormats([underline])
+            layout.beginLayout()
+            layout.createLine().setPosition(QPointF(0, 0))
+            layout.endLayout()
+            self._layouts[row] = layout
+        return layout
+
+    def _x_of(self, row: int, column: int) -> float:
+        text = self._display_text(row)
+        return self._layout(row).lineAt(0).cursorToX(_utf16_length(text[:column]))[0]
+
+    def _column_at(self, row: int, x: float) -> int:
+        column = _index_from_utf16(self._lines[row], self._layout(row).lineAt(0).xToCursor(x))
+        return min(column, len(self._lines[row]))
+
+    def _text_width(self) -> float:
+        return max(self._layout(row).lineAt(0).naturalTextWidth() for row in range(len(self._lines)))
+
+    def _compute_rect(self) -> QRect:
+        if not self.active:
+            return QRect()
+        width = max(self.MIN_WIDTH, int(self._text_width()) + 2 * self.PADDING + self.CARET_WIDTH + 1)
+        height = text_line_height(self.font) * len(self._lines) + 2 * self.PADDING
+        return QRect(self.origin.x(), self.origin.y(), width, height)
+
+    def _changed(self) -> QRegion:
+        """重新計算外框，回傳新舊外框的聯集 (文字方塊很小，整個重繪即可涵蓋游標與選取範圍)。"""
+        previous_rect = self._rect
+        self._rect = self._compute_rect()
+        return QRegion(previous_rect).united(QRegion(self._rect))
+
+    def _replace_lines(self, start: int, end: int, lines: list):
+        self._lines[start:end] = lines
+        self._layouts[start:end] = [None] * len(lines)
+
+    def _has_selection(self) -> bool:
+        return self._cursor != self._anchor
+
+    def _move_cursor(self, position: tuple, extend: bool):
+        """移動插入游標；不按 Shift 時取消選取範圍。"""
+        self._cursor = position
+        if not extend:
+            self._anchor = position
+
+    def _step(self, direction: int) -> tuple:
+        """游標往前 (-1) 或往後 (1) 一個字元的位置，可跨行。"""
+        row, column = self._cursor
+        if direction < 0:
+            if column > 0:
+                return row, column - 1
+            return (row - 1, len(self._lines[row - 1])) if row > 0 else (row, column)
+        if column < len(self._lines[row]):
+            return row, column + 1
+        return (row + 1, 0) if row < len(self._lines) - 1 else (row, column)
+
+    def _selected_text(self) -> str:
+        (start_row, start_column), (end_row, end_column) = sorted((self._cursor, self._anchor))
+        if start_row == end_row:
+            return self._lines[start_row][start_column:end_column]
+        lines = [self._lines[start_row][start_column:]] + self._lines[start_row + 1:end_row] + [self._lines[end_row][:end_column]]
+        return '\n'.join(lines)
+
+    def _copy_selection(self):
+        if self._has_selection():
+            QApplication.clipboard().setText(self._selected_text())
+
+    def _delete_selection(self) -> bool:
+        if not self._has_selection():
+            return False
+        (start_row, start_column), (end_row, end_column) = sorted((self._cursor, self._anchor))
+        merged = self._lines[start_row][:start_column] + self._lines[end_row][end_column:]
+        self._replace_lines(start_row, end_row + 1, [merged])
+        self._cursor = self._anchor = (start_row, start_column)
+        return True
@@ -162,6 +162,7 @@ class MovableToolbar(QWidget):
             4: 'text',
             5: 'laser_pointer',
             6: 'eraser',
+            7: 'pass_through',
         }
         new_tool = tool_map.get(button_id)
         if new_tool:
@@ -174,7 +175,7 @@ class MovableToolbar(QWidget):
                 self.set_text_options_visibility(True)
 
             # 根據工具決定是否啟用透明度滑桿
-            is_adjustable_opacity_tool = new_tool not in ['eraser', 'highlighter', 'laser_pointer']
+            is_adjustable_opacity_tool = new_tool not in ['eraser', 'highlighter', 'laser_pointer', 'pass_through']
             self.opacity_slider.setEnabled(is_adjustable_opacity_tool)
 
             self.tool_changed.emit(self.current_tool_name)
@@ -253,6 +254,7 @@ class MovableToolbar(QWidget):
             'text': 4,
             'laser_pointer': 5,
             'eraser': 6,
+            'pass_through': 7,
         }
         button_id = tool_map.get(tool_name)
         if button_id:
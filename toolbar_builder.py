@@ -6,9 +6,10 @@ from PyQt5.QtGui import QFont, QIcon, QPixmap, QColor
 from toolbar_icons import (
     HANDWRITING_ICON_SVG, HIGHLIGHTER_ICON_SVG,
     LINE_ICON_SVG, ARROW_ICON_SVG, RECTANGLE_ICON_SVG, CIRCLE_ICON_SVG, 
-    TEXT_ICON_SVG, LASER_ICON_SVG, ERASER_ICON_SVG
+    TEXT_ICON_SVG, LASER_ICON_SVG, ERASER_ICON_SVG, PASS_THROUGH_ICON_SVG
 )
 from flippable_button import FlippableButton
+from canvas_patterns import PATTERN_LABELS
 
 class ToolbarUIBuilder:
     """
@@ -34,6 +35,7 @@ class ToolbarUIBuilder:
         self.toolbar.text_icon = self._create_icon_from_svg(TEXT_ICON_SVG)
         self.toolbar.laser_icon = self._create_icon_from_svg(LASER_ICON_SVG)
         self.toolbar.eraser_icon = self._create_icon_from_svg(ERASER_ICON_SVG)
+        self.toolbar.pass_through_icon = self._create_icon_from_svg(PASS_THROUGH_ICON_SVG)
 
         # --- 工具列字體 ---
         toolbar_font = QFont("Arial", 10)
@@ -81,12 +83,19 @@ class ToolbarUIBuilder:
         self.layout.addWidget(eraser_button)
         self.toolbar.tool_button_group.addButton(eraser_button, 6)
 
+        # 半透明畫布的穿透區域：只有開啟輸入外形模式 (shape_transparent_overlay) 時才由畫布顯示
+        self.toolbar.pass_through_button = self._create_icon_button(
+            self.toolbar.pass_through_icon, "穿透區域 (7)：拖曳框選滑鼠可直接操作底下程式的範圍，點一下清除所有範圍")
+        self.toolbar.pass_through_button.hide()
+        self.layout.addWidget(self.toolbar.pass_through_button)
+        self.toolbar.tool_button_group.addButton(self.toolbar.pass_through_button, 7)
+
         # --- 畫布與樣式 ---
         self.toolbar.canvas_combo = self._create_combobox(["桌面", "黑板", "白板", "純色", "半透明", "讀取檔案"], toolbar_font)
         self.toolbar.canvas_combo.setToolTip("選擇畫布背景")
         self.layout.addWidget(self.toolbar.canvas_combo)
 
-        self.toolbar.pattern_combo = self._create_combobox(["無", "細方格", "粗方格"], toolbar_font)
+        self.toolbar.pattern_combo = self._create_combobox([label for _, label in PATTERN_LABELS], toolbar_font)
         self.toolbar.pattern_combo.setToolTip("選擇畫布格線樣式")
         self.layout.addWidget(self.toolbar.pattern_combo)
 
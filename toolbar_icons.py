@@ -9,4 +9,5 @@ RECTANGLE_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24
 CIRCLE_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white"><path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2zm0 18c-4.42 0-8-3.58-8-8s3.58-8 8-8 8 3.58 8 8-3.58 8-8 8z"/></svg>"""
 TEXT_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white"><path d="M5 4v3h5.5v12h3V7H19V4H5z"/></svg>"""
 LASER_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white"><path d="M12 3L9.25 8.25L4 11l5.25 2.75L12 19l2.75-5.25L20 11l-5.25-2.75zM19 17l-1.25 2.75L15 21l2.75 1.25L19 25l1.25-2.75L23 21l-2.75-1.25z"/></svg>"""
-ERASER_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white"><path d="M20.4,6.2 C20.2,6 19.9,5.9 19.6,5.9 L8.4,5.9 C8.1,5.9 7.8,6 7.6,6.2 L2.1,12 l5.5,5.8 C7.8,18 8.1,18.1 8.4,18.1 l11.2,0 c0.3,0 0.6-0.1 0.8-0.3l5.5-5.8L20.4,6.2z M8.6,16.7L4.3,12l4.3-4.7l4,4.7L8.6,16.7z"/></svg>"""
\ No newline at end of file
+ERASER_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white"><path d="M20.4,6.2 C20.2,6 19.9,5.9 19.6,5.9 L8.4,5.9 C8.1,5.9 7.8,6 7.6,6.2 L2.1,12 l5.5,5.8 C7.8,18 8.1,18.1 8.4,18.1 l11.2,0 c0.3,0 0.6-0.1 0.8-0.3l5.5-5.8L20.4,6.2z M8.6,16.7L4.3,12l4.3-4.7l4,4.7L8.6,16.7z"/></svg>"""
+PASS_THROUGH_ICON_SVG = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white"><path d="M3 3h4v2H5v2H3V3zm6 0h4v2H9V3zm6 0h4v4h-2V5h-2V3zM3 9h2v4H3V9zm0 6h2v2h2v2H3v-4z"/><path d="M11 10l9 3.5-3.8 1.4 2.8 2.8-1.4 1.4-2.8-2.8L13.4 20z"/></svg>"""
\ No newline at end of file